@@ -1,15 +1,29 @@
 from dotenv import load_dotenv
-from typing import Optional, Dict
+from typing import Any, AsyncIterator, Iterator, Optional, Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from collections import deque
+from threading import Lock
+import asyncio
+import hashlib
+import itertools
+import multiprocessing
 import time
 import os
 
 from storage.document_storage import DocumentStorage
-from storage.components import FileStorage, VectorStorage
+from storage.components import FileStorage, VectorStorage, IngestManifest, Registry, Metrics, TokenLocks
+from storage.components.metrics import SIZE_BUCKETS
 from app.text_utils import TextProcessor
+from app.answer_cache import AnswerCache
+from app.query_preprocessor import LocalQueryPreprocessor
+from app.llm_scheduler import LLMScheduler
+from app.context_builder import ContextAssembler
+from app.reranker import CrossEncoderReranker
+from app.file_watcher import FileWatcher
 
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai.chat_models import ChatOpenAI
+# langchain_core.prompts и langchain_openai импортируются лениво в __init__,
+# чтобы импорт модуля не замедлял запуск бота
 
 
 
@@ -69,39 +83,188 @@ class RAGOpenAiPipeline:
 
     3. Вход: "Пожалуйста, расскажите о процедуре увольнения по собственному желанию"
        Выход: "процедура увольнения, увольнение по собственному желанию"
-
-    Запрос для обработки: {query}
     """
 
+    QUERY_PREPROCESSORS = ("llm", "local", "hybrid")
+
     def __init__(self,
                  files_path=str(BASE_DIR / "infrastructure/files"),
                  vectors_path=str(BASE_DIR / "infrastructure/faiss"),
+                 registry_path: Optional[str] = None,
                  openai_model: str = "gpt-4o-mini",
                  openai_model_temperature: float = 0.1,
                  openai_proxy_url: str = "https://api.proxyapi.ru/openai/v1",
                  openai_system_prompt: str = None,
-                 vector_storage_kwargs: Optional[Dict[str, int]] = None):
+                 vector_storage_kwargs: Optional[Dict[str, Any]] = None,
+                 answer_cache_threshold: Optional[float] = None,
+                 answer_cache_size: int = 256,
+                 query_preprocessor: str = "llm",
+                 llm_scheduler_kwargs: Optional[Dict[str, Any]] = None,
+                 llm=None,
+                 context_token_budget: Optional[int] = 3000,
+                 rerank_kwargs: Optional[Dict[str, Any]] = None):
+
+        """Инициализирует пайплайн с хранилищами и моделями.
+
+        registry_path - файл SQLite-реестра токенов, документов и сессий
+        пользователей (по умолчанию registry.sqlite3 рядом с vectors_path).
+
+        answer_cache_threshold включает семантический кэш ответов: минимальное
+        косинусное сходство вопросов, при котором ответ берется из кэша.
+
+        query_preprocessor - режим предобработки запроса:
+            "llm" - переписывание запроса в ключевые слова через LLM;
+            "local" - локальная нормализация без обращения к LLM (LocalQueryPreprocessor);
+            "hybrid" - поиск запускается сразу по локально нормализованному запросу,
+                       а результат LLM-переписывания используется только в промпте ответа.
+
+        llm_scheduler_kwargs - параметры LLMScheduler (max_concurrency, rate, burst,
+        max_retries, ...), через который идут все запросы к LLM.
+
+        llm - готовая чат-модель langchain вместо ChatOpenAI (например, заглушка в бенчмарках).
+
+        context_token_budget - ограничение контекста в токенах: найденные чанки
+        склеиваются без повторов перекрытий и упаковываются в этот бюджет
+        (см. ContextAssembler); None - без ограничения.
+
+        rerank_kwargs включает переранжирование кросс-энкодером: из FAISS берется
+        больше кандидатов, и лучшие top_k выбираются по оценке модели (параметры
+        CrossEncoderReranker: model_name, fetch_k, time_budget, ...; {} - по умолчанию).
+        """
+        if query_preprocessor not in self.QUERY_PREPROCESSORS:
+            raise ValueError(f"Неизвестный режим предобработки запроса: {query_preprocessor}")
 
-        """Инициализирует пайплайн с хранилищами и моделями."""
         self.files_path = files_path
         self.vectors_path = vectors_path
 
+        # Длительности этапов, размеры промптов, обращения к кэшам (см. metrics.render)
+        self.metrics = Metrics()
+
         files_store = FileStorage(base_path=files_path)
         vectors_store = VectorStorage(
             base_path=vectors_path,
+            metrics=self.metrics,
             **(vector_storage_kwargs or {})
         )
 
-        self.document_store = DocumentStorage(vectors_store, files_store)
-
-        self.llm = ChatOpenAI(
-            model=openai_model,
-            temperature=openai_model_temperature,
-            api_key=os.environ.get("OPENAI_API_KEY"),
-            base_url=openai_proxy_url
-        )
+        registry = Registry(registry_path or Path(vectors_path).parent / "registry.sqlite3")
+
+        self.document_store = DocumentStorage(vectors_store, files_store, registry)
+        self.manifest = IngestManifest(base_path=Path(vectors_path) / ".manifest")
+        # Загрузка файлов одного токена (load_token, FileWatcher) идет по одной:
+        # манифест и индекс токена меняются целиком за время загрузки
+        self._ingest_locks = TokenLocks()
+
+        if llm is None:
+            from langchain_openai.chat_models import ChatOpenAI
+
+            llm = ChatOpenAI(
+                model=openai_model,
+                temperature=openai_model_temperature,
+                api_key=os.environ.get("OPENAI_API_KEY"),
+                base_url=openai_proxy_url,
+                # Повторы выполняет планировщик, с учетом общего лимита частоты
+                max_retries=0,
+                # Число токенов приходит и в потоковом ответе (для метрик)
+                stream_usage=True
+            )
+        self.llm = llm
+        self.llm_scheduler = LLMScheduler(**(llm_scheduler_kwargs or {}))
+        self._token_encoding = None
+        self._token_encoding_lock = Lock()
+        self.context_assembler = ContextAssembler(context_token_budget, self._count_tokens)
+        self._describe_metrics()
 
         self.system_prompt = openai_system_prompt or self.DEFAULT_SYSTEM_PROMPT
+        self._preprocess_chain = self._build_preprocess_chain()
+        self._answer_chain = self._build_answer_chain()
+
+        self.query_preprocessor = query_preprocessor
+        self.local_preprocessor = LocalQueryPreprocessor()
+
+        self.reranker = CrossEncoderReranker(**rerank_kwargs) if rerank_kwargs is not None else None
+
+        self.answer_cache = AnswerCache(
+            threshold=answer_cache_threshold,
+            max_entries_per_token=answer_cache_size
+        ) if answer_cache_threshold is not None else None
+
+    def _describe_metrics(self) -> None:
+        self.metrics.describe("rag_queries_total", "counter", "Запросы пользователей (mode=sync|async|stream)")
+        self.metrics.describe("rag_context_chars", "histogram", "Размер контекста в символах", SIZE_BUCKETS)
+        self.metrics.describe("rag_context_tokens", "histogram", "Размер контекста в токенах", SIZE_BUCKETS)
+        self.metrics.describe("rag_prompt_chars", "histogram", "Размер промпта ответа в символах", SIZE_BUCKETS)
+        self.metrics.describe("rag_prompt_tokens", "histogram", "Токены промпта по данным провайдера", SIZE_BUCKETS)
+        self.metrics.describe("rag_prompt_cached_tokens", "histogram",
+                              "Токены промпта, прочитанные из кэша префиксов провайдера", SIZE_BUCKETS)
+        self.metrics.describe("rag_completion_tokens", "histogram", "Токены ответа по данным провайдера", SIZE_BUCKETS)
+        self.metrics.describe("rag_rerank_total", "counter",
+                              "Переранжирования (result=reranked|timeout|not_ready|error)")
+        self.metrics.describe("rag_llm_waiting", "gauge", "Запросы к LLM, ожидающие свободного слота")
+        self.metrics.describe("rag_llm_calls", "gauge", "Вызовов LLM с момента запуска (с повторами)")
+        self.metrics.describe("rag_llm_retries", "gauge", "Повторов вызовов LLM с момента запуска")
+        self.metrics.describe("rag_llm_coalesced", "gauge", "Запросов, получивших результат одинакового запроса")
+        self.metrics.add_collector(self._collect_metrics)
+
+    def _collect_metrics(self, metrics: Metrics) -> None:
+        metrics.set("rag_llm_waiting", self.llm_scheduler.waiting)
+        for name, value in self.llm_scheduler.stats.items():
+            metrics.set(f"rag_llm_{name}", value)
+
+    def _stage(self, token: str, stage: str, operation: str = "query"):
+        """Контекстный менеджер, записывающий длительность этапа в метрики."""
+        return self.metrics.timer("rag_stage_seconds", operation=operation, stage=stage, token=token)
+
+    def load_token_encoding(self) -> None:
+        """
+        Загружает токенизатор модели OpenAI. При первом запуске tiktoken скачивает
+        файл словаря, поэтому вызывается при прогреве в отдельном потоке, а не в event loop.
+        """
+        with self._token_encoding_lock:
+            if self._token_encoding is not None:
+                return
+            self._token_encoding = False
+            model_name = getattr(self.llm, "model_name", None)
+            if model_name:
+                try:
+                    import tiktoken
+                    try:
+                        self._token_encoding = tiktoken.encoding_for_model(model_name)
+                    except KeyError:
+                        self._token_encoding = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    print(f"Подсчет токенов контекста недоступен: {e}")
+
+    def _count_tokens(self, text: str) -> Optional[int]:
+        """Число токенов по токенизатору модели OpenAI (None, если tiktoken недоступен)."""
+        if self._token_encoding is None:
+            self.load_token_encoding()
+        return len(self._token_encoding.encode(text)) if self._token_encoding else None
+
+    def _observe_generation(self, token: str, context: str, question: str, usage: Optional[dict]) -> None:
+        """Записывает размеры контекста и промпта и число токенов ответа."""
+        self.metrics.observe("rag_context_chars", len(context), token=token)
+        self.metrics.observe("rag_prompt_chars", len(self.system_prompt) + len(context) + len(question), token=token)
+        context_tokens = self._count_tokens(context)
+        if context_tokens is not None:
+            self.metrics.observe("rag_context_tokens", context_tokens, token=token)
+        if usage:
+            self.metrics.observe("rag_prompt_tokens", usage.get("input_tokens", 0), token=token)
+            cached = (usage.get("input_token_details") or {}).get("cache_read")
+            if cached is not None:
+                self.metrics.observe("rag_prompt_cached_tokens", cached, token=token)
+            self.metrics.observe("rag_completion_tokens", usage.get("output_tokens", 0), token=token)
+
+    def _lookup_answer(self, token: str, cache_key: tuple) -> Optional[str]:
+        """Ищет ответ в семантическом кэше и учитывает попадание в метриках."""
+        answer = self.answer_cache.lookup(*cache_key)
+        result = "hit" if answer is not None else "miss"
+        self.metrics.inc("rag_cache_requests_total", cache="answer", result=result, token=token)
+        return answer
+
+    def wait_ready(self, timeout: Optional[float] = None) -> None:
+        """Ждет окончания фоновой загрузки модели эмбеддингов."""
+        self.document_store.vector_store.wait_ready(timeout)
 
     def ingest(self,
                token: str,
@@ -119,10 +282,12 @@ class RAGOpenAiPipeline:
 
         filepath = os.path.join(input_dir, token, filename)
         if os.path.exists(filepath):
-            text = TextProcessor.extract_text(filepath)
-            if text:
+            # Текст читается постранично и сразу уходит в разбиение на чанки
+            pages = TextProcessor.iter_pages(filepath)
+            first_page = next(pages, None)
+            if first_page:
                 print(f"\nДобавление '{filename}' пользователю {token}:")
-                self.document_store.add_document(token, filename, text)
+                self.document_store.add_document(token, filename, itertools.chain([first_page], pages))
             else:
                 print(f"\nФайл {filename} не содержит текст")
         else:
@@ -133,15 +298,141 @@ class RAGOpenAiPipeline:
         Предварительно обрабатывает пользовательский запрос, удаляет все лишнее
         """
 
+        chain = self._preprocess_chain
+        response = self.llm_scheduler.call_sync(lambda: chain.invoke({"query": user_query}))
+
+        return response.content
+
+    async def _apreprocess_query(self, user_query: str, user=None):
+        """
+        Асинхронная версия _preprocess_query, не блокирует event loop.
+        Одинаковые запросы, отправленные одновременно, переписываются одним вызовом LLM.
+        """
+
+        chain = self._preprocess_chain
+        response = await self.llm_scheduler.call(
+            user,
+            lambda: chain.ainvoke({"query": user_query}),
+            key=("preprocess", user_query)
+        )
+
+        return response.content
+
+    def _build_preprocess_chain(self):
+        """Собирает цепочку промпт + LLM для предобработки запроса."""
+        from langchain_core.messages import SystemMessage
+        from langchain_core.prompts import ChatPromptTemplate
+
         prompt = ChatPromptTemplate.from_messages([
-            ("system", self.QUERY_PREPROCESS_PROMPT),
+            SystemMessage(content=self.QUERY_PREPROCESS_PROMPT),
             ("human", "{query}")
         ])
+        return prompt | self.llm
 
-        chain = prompt | self.llm
-        response = chain.invoke({"query": user_query})
+    def _build_answer_chain(self):
+        """
+        Собирает цепочку промпт + LLM для генерации ответа по контексту.
+        Системный промпт передается готовым сообщением (не шаблоном) и одинаков
+        побайтно во всех запросах, а контекст и вопрос идут после него: так
+        провайдер может переиспользовать кэш префикса промпта.
+        """
+        from langchain_core.messages import SystemMessage
+        from langchain_core.prompts import ChatPromptTemplate
 
-        return response.content
+        prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=self.system_prompt),
+            ("human", "Контекст:\n{context}\n\nВопрос:\n{question}")
+        ])
+        return prompt | self.llm
+
+    @staticmethod
+    def _build_question(user_query: str, processed_query: str) -> str:
+        return "Ввод пользователя: " + user_query + "\nНужен ответ про: " + processed_query
+
+    @staticmethod
+    def _answer_key(token: str, question: str, context: str) -> tuple:
+        """Ключ для объединения одинаковых одновременных запросов ответа."""
+        return "answer", token, question, hashlib.sha1(context.encode("utf-8")).hexdigest()
+
+    def _retrieve(self, token: str, query: str, top_k: int, rerank_query: Optional[str] = None):
+        """
+        Поиск релевантных чанков: эмбеддинг запроса и поиск по FAISS.
+        С переранжированием из FAISS берется fetch_k кандидатов, а лучшие top_k
+        выбирает кросс-энкодер по rerank_query (по умолчанию - query).
+        """
+        fetch_k = max(top_k, self.reranker.fetch_k) if self.reranker is not None else top_k
+        with self._stage(token, "retrieval"):
+            docs = self.document_store.search(
+                token=token,
+                query=query,
+                top_k=fetch_k
+            )
+        if self.reranker is None:
+            return docs
+
+        with self._stage(token, "rerank"):
+            docs, result = self.reranker.rerank(rerank_query or query, docs, top_k)
+        self.metrics.inc("rag_rerank_total", result=result, token=token)
+        return docs
+
+    def _prepare(self, token: str, user_query: str, top_k: int):
+        """
+        Предобработка запроса и поиск чанков в выбранном режиме query_preprocessor.
+        :return: (обработанный запрос, найденные чанки)
+        """
+        if self.query_preprocessor == "local":
+            with self._stage(token, "preprocess"):
+                processed_query = self.local_preprocessor.process(user_query)
+            return processed_query, self._retrieve(token, processed_query, top_k, user_query)
+
+        if self.query_preprocessor == "hybrid":
+            def rewrite_query():
+                with self._stage(token, "preprocess"):
+                    return self._preprocess_query(user_query)
+
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                rewrite = executor.submit(rewrite_query)
+                retrieved_docs = self._retrieve(token, self.local_preprocessor.process(user_query), top_k, user_query)
+                return rewrite.result(), retrieved_docs
+
+        with self._stage(token, "preprocess"):
+            processed_query = self._preprocess_query(user_query)
+        return processed_query, self._retrieve(token, processed_query, top_k, user_query)
+
+    async def _aprepare(self, token: str, user_query: str, top_k: int, user=None):
+        """Асинхронная версия _prepare, user - ключ очереди пользователя в планировщике LLM."""
+        if self.query_preprocessor == "local":
+            with self._stage(token, "preprocess"):
+                processed_query = self.local_preprocessor.process(user_query)
+            return processed_query, await asyncio.to_thread(self._retrieve, token, processed_query, top_k, user_query)
+
+        if self.query_preprocessor == "hybrid":
+            async def rewrite_query():
+                with self._stage(token, "preprocess"):
+                    return await self._apreprocess_query(user_query, user)
+
+            rewrite = asyncio.create_task(rewrite_query())
+            try:
+                retrieved_docs = await asyncio.to_thread(
+                    self._retrieve, token, self.local_preprocessor.process(user_query), top_k, user_query
+                )
+            except BaseException:
+                rewrite.cancel()
+                raise
+            return await rewrite, retrieved_docs
+
+        with self._stage(token, "preprocess"):
+            processed_query = await self._apreprocess_query(user_query, user)
+        return processed_query, await asyncio.to_thread(self._retrieve, token, processed_query, top_k, user_query)
+
+    def _answer_cache_key(self, token: str, user_query: str, retrieved_docs) -> tuple:
+        """Ключ семантического кэша: версия индекса, эмбеддинг вопроса и id найденных чанков."""
+        embedding = self.document_store.vector_store.embedding_model.embed_query(user_query)
+        chunk_ids = frozenset(
+            doc.id or hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+            for doc in retrieved_docs
+        )
+        return token, self.document_store.index_version(token), embedding, chunk_ids
 
     def query(self,
               token: str,
@@ -154,35 +445,312 @@ class RAGOpenAiPipeline:
         :param top_k: Количество возвращённых ретривером чанков
         :return: content - результат генерации LLM по промпту и контексту из ретривера
         """
-        start_time = time.time()
-        processed_query = self._preprocess_query(user_query)
-
-        start_time = time.time()
-        retriever = self.document_store.get_retriever(
-            token=token,
-            top_k=top_k
-        )
-
-        retrieved_docs = retriever.invoke(processed_query)
-        context = "\n\n".join(doc.page_content for doc in retrieved_docs)
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", self.system_prompt + f"\nКонтекст:{context}"),
-            ("human", "Вопрос:\n{question}")
-        ])
-
-        chain = prompt | self.llm
-        response = chain.invoke({"question": "Ввод пользователя: " + user_query + "\nНужен ответ про: " + processed_query})
+        self.metrics.inc("rag_queries_total", token=token, mode="sync")
+        processed_query, retrieved_docs = self._prepare(token, user_query, top_k)
+
+        cache_key = None
+        if self.answer_cache is not None:
+            cache_key = self._answer_cache_key(token, user_query, retrieved_docs)
+            answer = self._lookup_answer(token, cache_key)
+            if answer is not None:
+                return answer
+
+        context = self.context_assembler.assemble(retrieved_docs)
+
+        chain = self._answer_chain
+        question = self._build_question(user_query, processed_query)
+        with self._stage(token, "generation"):
+            response = self.llm_scheduler.call_sync(lambda: chain.invoke({"context": context, "question": question}))
+        self._observe_generation(token, context, question, response.usage_metadata)
+
+        if cache_key is not None:
+            self.answer_cache.store(*cache_key, response.content)
+        return response.content
 
+    async def aquery(self,
+                     token: str,
+                     user_query: str,
+                     top_k: int = 5,
+                     user_id: Optional[int] = None):
+        """
+        Асинхронная версия query для использования из обработчиков бота.
+        Вызовы LLM выполняются через ainvoke, а эмбеддинг запроса и поиск по FAISS
+        вынесены в отдельный поток, поэтому event loop не блокируется.
+        :param token: Уникальный идентификатор пользователя
+        :param user_query: Текстовый запрос от пользователя
+        :param top_k: Количество возвращённых ретривером чанков
+        :param user_id: Идентификатор пользователя для очереди планировщика LLM (по умолчанию токен)
+        :return: content - результат генерации LLM по промпту и контексту из ретривера
+        """
+        user = user_id if user_id is not None else token
+        self.metrics.inc("rag_queries_total", token=token, mode="async")
+        processed_query, retrieved_docs = await self._aprepare(token, user_query, top_k, user)
+
+        cache_key = None
+        if self.answer_cache is not None:
+            cache_key = await asyncio.to_thread(self._answer_cache_key, token, user_query, retrieved_docs)
+            answer = self._lookup_answer(token, cache_key)
+            if answer is not None:
+                return answer
+
+        # Подсчет токенов контекста - в отдельном потоке, как и поиск
+        context = await asyncio.to_thread(self.context_assembler.assemble, retrieved_docs)
+
+        chain = self._answer_chain
+        question = self._build_question(user_query, processed_query)
+        with self._stage(token, "generation"):
+            response = await self.llm_scheduler.call(
+                user,
+                lambda: chain.ainvoke({"context": context, "question": question}),
+                key=self._answer_key(token, question, context)
+            )
+        await asyncio.to_thread(self._observe_generation, token, context, question, response.usage_metadata)
+
+        if cache_key is not None:
+            self.answer_cache.store(*cache_key, response.content)
         return response.content
 
+    async def astream_query(self,
+                            token: str,
+                            user_query: str,
+                            top_k: int = 5,
+                            user_id: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        Потоковая версия aquery: отдает ответ LLM по частям по мере генерации.
+        Ответ из семантического кэша отдается одной частью.
+        :param token: Уникальный идентификатор пользователя
+        :param user_query: Текстовый запрос от пользователя
+        :param top_k: Количество возвращённых ретривером чанков
+        :param user_id: Идентификатор пользователя для очереди планировщика LLM (по умолчанию токен)
+        :return: асинхронный генератор фрагментов ответа
+        """
+        user = user_id if user_id is not None else token
+        self.metrics.inc("rag_queries_total", token=token, mode="stream")
+        processed_query, retrieved_docs = await self._aprepare(token, user_query, top_k, user)
+
+        cache_key = None
+        if self.answer_cache is not None:
+            cache_key = await asyncio.to_thread(self._answer_cache_key, token, user_query, retrieved_docs)
+            answer = self._lookup_answer(token, cache_key)
+            if answer is not None:
+                yield answer
+                return
+
+        context = await asyncio.to_thread(self.context_assembler.assemble, retrieved_docs)
+
+        chain = self._answer_chain
+        question = self._build_question(user_query, processed_query)
+
+        usage = {}
+
+        async def make_stream():
+            async for chunk in chain.astream({"context": context, "question": question}):
+                if chunk.usage_metadata:
+                    usage.update(chunk.usage_metadata)
+                if chunk.content:
+                    yield chunk.content
+
+        parts = []
+        start_time = time.perf_counter()
+        stream = self.llm_scheduler.stream(user, make_stream, key=self._answer_key(token, question, context))
+        async for content in stream:
+            if not parts:
+                self.metrics.observe("rag_stage_seconds", time.perf_counter() - start_time,
+                                     operation="query", stage="first_chunk", token=token)
+            parts.append(content)
+            yield content
+        self.metrics.observe("rag_stage_seconds", time.perf_counter() - start_time,
+                             operation="query", stage="generation", token=token)
+        await asyncio.to_thread(self._observe_generation, token, context, question, usage)
+
+        if cache_key is not None:
+            self.answer_cache.store(*cache_key, "".join(parts))
+
     def load_token(self,
                    token: str,
-                   path_to_files: str = "../infrastructure/files"):
+                   path_to_files: str = "../infrastructure/files",
+                   bulk: bool = True,
+                   workers: Optional[int] = None):
+        """
+        Добавляет в хранилище все файлы токена.
+
+        Args:
+            token (str): Токен, файлы которого нужно загрузить
+            path_to_files (str, optional): Директория файлового хранилища
+            bulk (bool, optional): Пакетный режим (см. bulk_ingest). Если False,
+                                   файлы добавляются по одному через ingest.
+            workers (int, optional): Число процессов для извлечения текста
+        """
         token_path = path_to_files + f"/{token}"
-        for file in os.listdir(token_path):
-            self.ingest(token=token, filename=file, input_dir=path_to_files)
+        filenames = [
+            filename for filename in os.listdir(token_path)
+            if FileWatcher.is_document(Path(token_path) / filename)
+        ]
+        if not bulk:
+            for file in filenames:
+                self.ingest(token=token, filename=file, input_dir=path_to_files)
+            return None
+        return self.bulk_ingest(token, filenames, path_to_files, workers)
+
+    def bulk_ingest(self,
+                    token: str,
+                    filenames: List[str],
+                    input_dir: str = "../infrastructure/files",
+                    workers: Optional[int] = None) -> Dict[str, float]:
+        """
+        Пакетно добавляет файлы: текст извлекается в пуле процессов, эмбеддинги
+        считаются одним прогоном по чанкам всех файлов, индекс записывается один раз.
+        Неизмененные с прошлого запуска файлы (по манифесту) не разбираются повторно,
+        а измененные обновляются по разнице чанков (см. DocumentStorage.upsert_document).
+
+        Args:
+            token (str): Токен, к которому добавляются файлы
+            filenames (List[str]): Имена файлов (без пути)
+            input_dir (str, optional): Директория файлового хранилища
+            workers (int, optional): Число процессов для извлечения текста,
+                                     по умолчанию os.cpu_count()
+
+        Returns:
+            Dict[str, float]: время и пропускная способность по этапам
+        """
+        with self._ingest_locks.build(token):
+            return self._bulk_ingest(token, filenames, input_dir, workers)
+
+    def _bulk_ingest(self,
+                     token: str,
+                     filenames: List[str],
+                     input_dir: str,
+                     workers: Optional[int]) -> Dict[str, float]:
+        """Тело bulk_ingest, выполняется под блокировкой загрузки токена."""
+        vector_store = self.document_store.vector_store
+        cached = []
+        changed = set()
+        to_extract = []
+        skipped = 0
+        for filename in filenames:
+            path = Path(input_dir) / token / filename
+            status = self.manifest.status(token, filename, path)
+            if vector_store.document_exists(token, filename):
+                if status == IngestManifest.INDEXED or not self.manifest.is_changed(token, filename, path):
+                    # Файлы, проиндексированные до появления манифеста, считаем актуальными
+                    self.manifest.mark_indexed(token, filename, path)
+                    skipped += 1
+                    continue
+                changed.add(filename)
+            if status != IngestManifest.NEW:
+                cached.append(filename)
+            else:
+                to_extract.append(filename)
+
+        for filename in changed:
+            print(f"\nФайл {filename} изменился, будет обновлен по разнице чанков")
+
+        ingested = []
+        extraction = {"seconds": 0.0}
+
+        def documents():
+            """Тексты файлов по одному, по мере извлечения - в памяти не копятся все файлы сразу."""
+            extracted = self._extract_pages(
+                [os.path.join(input_dir, token, filename) for filename in to_extract], workers
+            )
+            for filename in cached + to_extract:
+                path = Path(input_dir) / token / filename
+                start_time = time.perf_counter()
+                pages = self.manifest.cached_pages(token, filename) if filename in cached else next(extracted)
+                if pages is None:
+                    pages = TextProcessor.extract_pages(str(path))
+                if pages and filename not in cached:
+                    self.manifest.record_pages(token, filename, path, pages)
+                extraction["seconds"] += time.perf_counter() - start_time
+                if not pages and filename not in changed:
+                    print(f"\nФайл {filename} не содержит текст")
+                    continue
+                # Из измененного файла мог не извлечься текст - тогда старые чанки удалятся
+                ingested.append(filename)
+                yield filename, pages or []
+
+        # Новые и измененные файлы применяются к одной копии индекса, запись - одна
+        print(f"\nПакетное добавление {len(cached) + len(to_extract) - len(changed)} файлов "
+              f"пользователю {token} (без изменений: {skipped}, обновлено: {len(changed)}):")
+        report = self.document_store.upsert_documents(token, documents()) if cached or to_extract else {}
+        for filename in ingested:
+            self.manifest.mark_indexed(token, filename, Path(input_dir) / token / filename)
+        self.manifest.save(token)
+
+        extraction_s = extraction["seconds"]
+        self.metrics.observe("rag_stage_seconds", extraction_s, operation="ingest", stage="extraction", token=token)
+        report["files"] = len(to_extract)
+        report["skipped"] = skipped
+        report["updated"] = len(changed)
+        report["extraction_s"] = extraction_s
+        report["extraction_files_per_s"] = len(to_extract) / max(extraction_s, 1e-9)
+        self._print_ingest_report(report)
+        return report
+
+    @staticmethod
+    def _extract_pages(paths: List[str], workers: Optional[int]) -> Iterator[List[Tuple[Optional[int], str]]]:
+        """
+        Извлекает блоки (страница, текст) файлов и отдает их по порядку по мере готовности.
+        С несколькими файлами извлечение идет в пуле процессов, и в работе не больше
+        двух файлов на процесс, чтобы извлеченные тексты не копились, пока считаются эмбеддинги.
+        """
+        workers = workers or os.cpu_count() or 1
+        if len(paths) <= 1 or workers <= 1:
+            for path in paths:
+                yield TextProcessor.extract_pages(path)
+            return
+
+        # spawn, а не fork: в процессе уже работают потоки (прогрев модели,
+        # asyncio.to_thread), и форк многопоточного процесса может зависнуть
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            remaining = iter(paths)
+            pending = deque(
+                pool.submit(TextProcessor.extract_pages, path)
+                for path in itertools.islice(remaining, 2 * workers)
+            )
+            while pending:
+                pages = pending.popleft().result()
+                path = next(remaining, None)
+                if path is not None:
+                    pending.append(pool.submit(TextProcessor.extract_pages, path))
+                yield pages
+
+    def sync_token(self,
+                   token: str,
+                   path_to_files: Optional[str] = None,
+                   workers: Optional[int] = None) -> Dict[str, float]:
+        """
+        Приводит документы токена к содержимому его директории: новые файлы
+        добавляются, измененные обновляются по разнице чанков, удаленные с диска
+        удаляются из хранилища.
+        """
+        path_to_files = path_to_files or self.files_path
+        token_path = Path(path_to_files) / token
+        with self._ingest_locks.build(token):
+            filenames = [
+                path.name for path in token_path.iterdir() if FileWatcher.is_document(path)
+            ] if token_path.exists() else []
+            for filename in set(self.document_store.list_documents(token)) - set(filenames):
+                print(f"\nФайл {filename} удален с диска, удаление из хранилища пользователя {token}")
+                self.document_store.delete_document(token, filename)
+                self.manifest.forget(token, filename)
+            return self.bulk_ingest(token, filenames, path_to_files, workers)
+
+    @staticmethod
+    def _print_ingest_report(report: Dict[str, float]) -> None:
+        print(f"   извлечение текста: {report['files']} файлов за {report['extraction_s']:.2f} с "
+              f"({report['extraction_files_per_s']:.1f} файлов/с)")
+        if "embedding_s" in report:
+            print(f"   разбиение на чанки: {report['chunks']} чанков за {report['chunking_s']:.2f} с")
+            print(f"   эмбеддинги: {report['embedding_s']:.2f} с "
+                  f"({report['embedding_chunks_per_s']:.1f} чанков/с, "
+                  f"из общего кэша: {report.get('cached_chunks', 0)})")
+            print(f"   запись индекса: {report['persist_s']:.2f} с")
 
     def list_documents(self,
                        token: str):
-        return self.document_store.list_documents(token)
\ No newline at end of file
+        return self.document_store.list_documents(token)
+
+    async def alist_documents(self,
+                              token: str):
+        return await asyncio.to_thread(self.document_store.list_documents, token)
\ No newline at end of file
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+
+class AnswerCache:
+    """Семантический кэш ответов LLM по токенам.
+
+    Хранит (эмбеддинг вопроса, id найденных чанков, ответ). Ответ отдается из кэша,
+    если новый вопрос близок к сохраненному по косинусу (не ниже threshold) и ретривер
+    вернул тот же набор чанков. При изменении индекса токена его записи сбрасываются.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries_per_token: int = 256):
+        self.threshold = threshold
+        self.max_entries_per_token = max_entries_per_token
+        # token -> (версия индекса, OrderedDict[id записи -> (вектор, id чанков, ответ)])
+        self._tokens: Dict[str, Tuple[int, "OrderedDict[int, tuple]"]] = {}
+        self._next_id = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _entries(self, token: str, version: int) -> "OrderedDict[int, tuple]":
+        current = self._tokens.get(token)
+        if current is None or current[0] != version:
+            current = self._tokens[token] = (version, OrderedDict())
+        return current[1]
+
+    def lookup(self,
+               token: str,
+               version: int,
+               embedding: List[float],
+               chunk_ids: FrozenSet[str]) -> Optional[str]:
+        """Возвращает сохраненный ответ на близкий вопрос или None."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            entries = self._entries(token, version)
+            best_id, best_score = None, self.threshold
+            for entry_id, (cached_vector, cached_chunk_ids, _) in entries.items():
+                if cached_chunk_ids != chunk_ids:
+                    continue
+                score = float(np.dot(vector, cached_vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(best_id)
+            self.hits += 1
+            return entries[best_id][2]
+
+    def store(self,
+              token: str,
+              version: int,
+              embedding: List[float],
+              chunk_ids: FrozenSet[str],
+              answer: str) -> None:
+        """Сохраняет ответ, вытесняя самые давно использованные записи токена."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            entries = self._entries(token, version)
+            entries[self._next_id] = (vector, chunk_ids, answer)
+            self._next_id += 1
+            while len(entries) > self.max_entries_per_token:
+                entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": sum(len(entries) for _, entries in self._tokens.values())
+        }
@@ -0,0 +1,114 @@
+from typing import Callable, Dict, List, Optional
+import math
+
+from langchain_core.documents import Document
+
+
+class _Span:
+    """Непрерывный фрагмент документа, собранный из одного или нескольких чанков."""
+
+    def __init__(self, doc: Document, rank: int):
+        self.filename = doc.metadata.get("filename", "")
+        self.block = doc.metadata.get("block")
+        self.start = doc.metadata.get("start_index")
+        self.text = doc.page_content
+        self.end = self.start + len(self.text) if self.start is not None else None
+        self.rank = rank
+
+    @property
+    def positioned(self) -> bool:
+        return self.block is not None and self.start is not None
+
+
+class ContextAssembler:
+    """Сборка контекста для промпта из найденных чанков.
+
+    Чанки одного файла, которые перекрываются или идут вплотную (по block и
+    start_index в метаданных), склеиваются в один фрагмент без повторов
+    перекрытия, точные дубликаты отбрасываются. Фрагменты упаковываются в
+    token_budget по убыванию релевантности (лучший ранг входящих чанков), а в
+    контекст выводятся сгруппированными по файлам и в порядке следования в документе.
+    Для чанков старых индексов без позиций выполняется только удаление дубликатов.
+    """
+
+    # Оценка длины токена, если точный подсчет недоступен (русский текст - около 3 символов)
+    CHARS_PER_TOKEN = 3.0
+    SPAN_SEPARATOR = "\n...\n"
+
+    def __init__(self,
+                 token_budget: Optional[int] = None,
+                 count_tokens: Optional[Callable[[str], Optional[int]]] = None):
+        """token_budget - ограничение контекста в токенах (None - без ограничения),
+        count_tokens - функция подсчета токенов (может вернуть None)."""
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens
+
+    def _tokens(self, text: str) -> int:
+        count = self.count_tokens(text) if self.count_tokens else None
+        return count if count is not None else math.ceil(len(text) / self.CHARS_PER_TOKEN)
+
+    @staticmethod
+    def _header(filename: str) -> str:
+        return f"[{filename}]\n"
+
+    def spans(self, docs: List[Document]) -> List[_Span]:
+        """Склеивает чанки в фрагменты; порядок - по релевантности."""
+        seen = set()
+        by_file: Dict[str, List[_Span]] = {}
+        for rank, doc in enumerate(docs):
+            if doc.page_content in seen:
+                continue
+            seen.add(doc.page_content)
+            span = _Span(doc, rank)
+            by_file.setdefault(span.filename, []).append(span)
+
+        result = []
+        for items in by_file.values():
+            merged: List[_Span] = []
+            for span in sorted((s for s in items if s.positioned), key=lambda s: (s.block, s.start)):
+                last = merged[-1] if merged else None
+                if last is not None and last.block == span.block and span.start <= last.end:
+                    if span.end > last.end:
+                        last.text += span.text[last.end - span.start:]
+                        last.end = span.end
+                    last.rank = min(last.rank, span.rank)
+                else:
+                    merged.append(span)
+            result.extend(merged)
+            result.extend(s for s in items if not s.positioned)
+        return sorted(result, key=lambda s: s.rank)
+
+    def _pack(self, spans: List[_Span]) -> List[_Span]:
+        """Отбирает фрагменты в порядке релевантности, пока они помещаются в бюджет."""
+        if self.token_budget is None:
+            return spans
+        remaining = self.token_budget
+        files = set()
+        selected = []
+        for span in spans:
+            cost = self._tokens(span.text + self.SPAN_SEPARATOR)
+            if span.filename not in files:
+                cost += self._tokens(self._header(span.filename))
+            if cost > remaining:
+                if selected:
+                    continue
+                # Самый релевантный фрагмент не помещается целиком - берется его начало
+                span.text = span.text[:max(0, int(len(span.text) * remaining / cost))]
+                cost = remaining
+            selected.append(span)
+            files.add(span.filename)
+            remaining -= cost
+        return selected
+
+    def assemble(self, docs: List[Document]) -> str:
+        """Возвращает текст контекста: фрагменты по файлам в порядке следования в документе."""
+        selected = self._pack(self.spans(docs))
+        by_file: Dict[str, List[_Span]] = {}
+        for span in selected:
+            by_file.setdefault(span.filename, []).append(span)
+
+        sections = []
+        for filename, items in sorted(by_file.items(), key=lambda item: min(s.rank for s in item[1])):
+            items.sort(key=lambda s: (not s.positioned, s.block or 0, s.start or 0, s.rank))
+            sections.append(self._header(filename) + self.SPAN_SEPARATOR.join(s.text for s in items))
+        return "\n\n".join(sections)
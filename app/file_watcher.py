@@ -0,0 +1,89 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import asyncio
+
+from storage.document_storage import DocumentStorage
+
+# Размер и mtime каждого файла директории токена
+Signature = Dict[str, Tuple[int, int]]
+
+
+class FileWatcher:
+    """
+    Следит за директориями токенов в файловом хранилище (files_path/<token>)
+    и применяет изменения файлов к индексу через RAGOpenAiPipeline.sync_token.
+
+    Директории опрашиваются раз в interval секунд по размеру и mtime файлов,
+    без внешних зависимостей. Токен синхронизируется, когда его директория
+    изменилась и не менялась с предыдущего опроса, поэтому файл, который еще
+    копируется, не попадает в индекс недописанным. Первый опрос только
+    запоминает исходное состояние.
+    """
+
+    # Временные и служебные файлы (блокировки офисных редакторов, атомарная запись)
+    IGNORED_PREFIXES = (".", "~$")
+    IGNORED_SUFFIXES = (".tmp", ".part", ".swp")
+    IGNORED_NAMES = (DocumentStorage.PLACEHOLDER_FILE,)
+
+    def __init__(self, pipeline, files_path: Optional[str] = None, interval: float = 5.0):
+        self.pipeline = pipeline
+        self.files_path = Path(files_path or pipeline.files_path)
+        self.interval = interval
+        self._seen: Dict[str, Signature] = {}
+        self._synced: Dict[str, Signature] = {}
+
+    @classmethod
+    def is_document(cls, path: Path) -> bool:
+        """Проверяет, что файл - документ, а не временный или служебный файл."""
+        return (
+            path.is_file()
+            and not path.name.startswith(cls.IGNORED_PREFIXES)
+            and not path.name.endswith(cls.IGNORED_SUFFIXES)
+            and path.name not in cls.IGNORED_NAMES
+        )
+
+    def scan(self) -> Dict[str, Signature]:
+        """Возвращает размеры и mtime файлов в директориях известных токенов."""
+        result = {}
+        for token in self.pipeline.document_store.list_user_tokens():
+            token_path = self.files_path / token
+            signature = {}
+            if token_path.exists():
+                for path in token_path.iterdir():
+                    try:
+                        if self.is_document(path):
+                            stat = path.stat()
+                            signature[path.name] = (stat.st_size, stat.st_mtime_ns)
+                    except FileNotFoundError:
+                        continue
+            result[token] = signature
+        return result
+
+    def poll(self) -> List[str]:
+        """Один опрос: синхронизирует изменившиеся токены и возвращает их список."""
+        current = self.scan()
+        synced = []
+        for token, signature in current.items():
+            if token not in self._synced:
+                self._synced[token] = signature
+            elif signature == self._seen.get(token) and signature != self._synced[token]:
+                try:
+                    self.pipeline.sync_token(token, str(self.files_path))
+                except Exception as e:
+                    print(f"Ошибка обновления документов токена {token}: {e}")
+                    continue
+                self._synced[token] = signature
+                synced.append(token)
+        self._seen = current
+        return synced
+
+    async def run(self, stop: Optional[asyncio.Event] = None) -> None:
+        """Опрашивает директории до установки stop; синхронизация идет в отдельном потоке."""
+        stop = stop or asyncio.Event()
+        print(f"Отслеживание изменений файлов в {self.files_path} (раз в {self.interval} с)")
+        while not stop.is_set():
+            await asyncio.to_thread(self.poll)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
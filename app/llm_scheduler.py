@@ -0,0 +1,300 @@
+from collections import OrderedDict, deque
+from threading import BoundedSemaphore
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+import asyncio
+import random
+import time
+
+from app.rate_limit import TokenBucket
+
+# Коды ответа, при которых запрос к LLM имеет смысл повторить
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# Ошибки openai без кода ответа (сеть, таймаут)
+RETRY_ERROR_NAMES = {"APIConnectionError", "APITimeoutError"}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Проверяет, стоит ли повторять запрос после ошибки."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUS_CODES
+    return type(error).__name__ in RETRY_ERROR_NAMES or isinstance(error, (TimeoutError, ConnectionError))
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Возвращает задержку из заголовка Retry-After ответа провайдера, если он есть."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class FairSemaphore:
+    """Ограничение числа одновременных вызовов с обслуживанием очереди по кругу.
+
+    У каждого пользователя своя очередь, освободившийся слот достается первому
+    запросу следующего по кругу пользователя. Поэтому пользователь с десятком
+    вопросов не задерживает тех, кто спросил один раз.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active = 0
+        self._queues: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+
+    async def acquire(self, user: Hashable) -> None:
+        if self._active < self.limit and not self._queues:
+            self._active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Слот мог быть выдан одновременно с отменой - его нужно вернуть
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self._active -= 1
+        while self._active < self.limit and self._queues:
+            user, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            if future.cancelled():
+                continue
+            self._active += 1
+            future.set_result(None)
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+
+class _Broadcast:
+    """Фрагменты потокового ответа, которые получают все запросы с тем же ключом."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+        self.producer: Optional[asyncio.Task] = None
+        self._event = asyncio.Event()
+
+    def _notify(self) -> None:
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    def push(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def follow(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._event.wait()
+
+
+class LLMScheduler:
+    """Планировщик запросов к LLM.
+
+    - не больше max_concurrency одновременных запросов, свободные слоты
+      раздаются пользователям по кругу (FairSemaphore);
+    - частота запросов ограничена token bucket (rate в секунду, всплеск burst);
+    - при 429/5xx и сетевых ошибках запрос повторяется до max_retries раз с
+      экспоненциальной задержкой и случайным разбросом (full jitter), с учетом Retry-After;
+    - одинаковые запросы (по ключу), пришедшие, пока первый еще выполняется,
+      не отправляются повторно, а получают его результат.
+
+    Синхронные вызовы (call_sync, для CLI и скриптов) используют то же ведро
+    и повторы, но свой пул слотов без очередей по пользователям.
+    """
+
+    def __init__(self,
+                 max_concurrency: int = 8,
+                 rate: float = 5.0,
+                 burst: int = 10,
+                 max_retries: int = 4,
+                 base_delay: float = 0.5,
+                 max_delay: float = 20.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(rate, burst)
+        self._slots = FairSemaphore(max_concurrency)
+        self._sync_slots = BoundedSemaphore(max_concurrency)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, _Broadcast] = {}
+        self.stats = {"calls": 0, "retries": 0, "coalesced": 0}
+
+    def _delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """Задержка перед повтором или None, если повторять не нужно."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after(error) or 0.0)
+
+    def _log_retry(self, error: BaseException, attempt: int, delay: float) -> None:
+        self.stats["retries"] += 1
+        print(f"LLM: повтор {attempt}/{self.max_retries} через {delay:.1f} с ({type(error).__name__})")
+
+    async def call(self,
+                   user: Hashable,
+                   make_call: Callable[[], Awaitable[Any]],
+                   key: Optional[Hashable] = None) -> Any:
+        """Выполняет make_call() с ограничениями и повторами.
+
+        Если запрос с тем же key уже выполняется, ждет его результат.
+        """
+        if key is None:
+            return await self._call(user, make_call)
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        # Исключение может никто не забрать, если параллельных запросов не было
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result = await self._call(user, make_call)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        future.set_result(result)
+        return result
+
+    async def _call(self, user: Hashable, make_call: Callable[[], Awaitable[Any]]) -> Any:
+        attempt = 0
+        while True:
+            await self._slots.acquire(user)
+            try:
+                await asyncio.sleep(self.bucket.reserve())
+                self.stats["calls"] += 1
+                return await make_call()
+            except Exception as e:
+                error = e
+                delay = self._delay(e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self._slots.release()
+            attempt += 1
+            self._log_retry(error, attempt, delay)
+            await asyncio.sleep(delay)
+
+    async def stream(self,
+                     user: Hashable,
+                     make_stream: Callable[[], AsyncIterator[str]],
+                     key: Optional[Hashable] = None) -> AsyncIterator[str]:
+        """Потоковый вариант call: отдает фрагменты ответа по мере получения.
+
+        Ответ читается из LLM в отдельной задаче, которая складывает фрагменты
+        в _Broadcast и освобождает слот сразу по окончании генерации, а все
+        запросы (и первый, и присоединившиеся) читают из него. Поэтому медленный
+        получатель (например, чат с ограничением на правку сообщений) не держит
+        слот LLM. Повтор возможен только до первого фрагмента. Запросы с тем же
+        key, пришедшие во время генерации, получают те же фрагменты с самого начала.
+        Если все получатели ушли до конца генерации, она отменяется.
+        """
+        broadcast = self._streams.get(key) if key is not None else None
+        if broadcast is not None:
+            self.stats["coalesced"] += 1
+            producer = None
+        else:
+            broadcast = _Broadcast()
+            producer = asyncio.create_task(self._produce(user, make_stream, broadcast))
+            if key is not None:
+                self._streams[key] = broadcast
+                producer.add_done_callback(lambda _: self._streams.pop(key, None))
+            broadcast.producer = producer
+
+        broadcast.followers += 1
+        try:
+            async for chunk in broadcast.follow():
+                yield chunk
+        finally:
+            broadcast.followers -= 1
+            if broadcast.followers == 0 and not broadcast.done:
+                broadcast.producer.cancel()
+
+    async def _produce(self,
+                       user: Hashable,
+                       make_stream: Callable[[], AsyncIterator[str]],
+                       broadcast: _Broadcast) -> None:
+        """Читает ответ LLM в broadcast; слот занят только на время генерации."""
+        attempt = 0
+        try:
+            while True:
+                await self._slots.acquire(user)
+                started = False
+                try:
+                    await asyncio.sleep(self.bucket.reserve())
+                    self.stats["calls"] += 1
+                    async for chunk in make_stream():
+                        started = True
+                        broadcast.push(chunk)
+                    broadcast.close()
+                    return
+                except Exception as e:
+                    error = e
+                    delay = None if started else self._delay(e, attempt)
+                    if delay is None:
+                        broadcast.close(e)
+                        return
+                finally:
+                    self._slots.release()
+                attempt += 1
+                self._log_retry(error, attempt, delay)
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            broadcast.close(RuntimeError("Генерация ответа прервана"))
+            raise
+
+    def call_sync(self, make_call: Callable[[], Any]) -> Any:
+        """Синхронный вызов с ограничением частоты и повторами."""
+        attempt = 0
+        while True:
+            with self._sync_slots:
+                time.sleep(self.bucket.reserve())
+                self.stats["calls"] += 1
+                try:
+                    return make_call()
+                except Exception as e:
+                    error = e
+                    delay = self._delay(e, attempt)
+                    if delay is None:
+                        raise
+            attempt += 1
+            self._log_retry(error, attempt, delay)
+            time.sleep(delay)
+
+    @property
+    def waiting(self) -> int:
+        """Число запросов, ожидающих свободного слота."""
+        return self._slots.waiting
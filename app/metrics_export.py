@@ -0,0 +1,42 @@
+from typing import Optional
+import asyncio
+import json
+import time
+
+from storage.components import Metrics
+
+
+async def serve_metrics(metrics: Metrics, port: int, host: str = "0.0.0.0"):
+    """Запускает HTTP-сервер с метриками в формате Prometheus на /metrics.
+
+    Возвращает aiohttp AppRunner; для остановки вызовите await runner.cleanup().
+    """
+    from aiohttp import web
+
+    async def handle(request):
+        text = await asyncio.to_thread(metrics.render)
+        return web.Response(text=text, content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
+
+
+async def log_metrics(metrics: Metrics, interval: float, stop: Optional[asyncio.Event] = None) -> None:
+    """Каждые interval секунд печатает метрики одной JSON-строкой."""
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        snapshot = await asyncio.to_thread(metrics.snapshot)
+        print(json.dumps(
+            {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "metrics": snapshot},
+            ensure_ascii=False,
+            separators=(",", ":")
+        ))
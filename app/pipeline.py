@@ -37,7 +37,7 @@ if __name__ == "__main__":
             continue
 
         try:
-            answer = pipeline.query(user_token, user_input, top_k=7)
+            answer = pipeline.query(user_token, user_input, top_k=5)
             print("\n\033[35mРобот Алёша:\033[0m")
             print(answer)
 
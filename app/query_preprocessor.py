@@ -0,0 +1,79 @@
+import re
+
+
+class LocalQueryPreprocessor:
+    """
+    Локальная предобработка запроса без обращения к LLM.
+
+    Удаляет приветствия, формы вежливости, смайлики и служебные слова (русские и
+    английские) и оставляет ключевые слова запроса. Слова с цифрами (номера форм,
+    "2-НДФЛ") и аббревиатуры сохраняются.
+    """
+
+    # Устойчивые вежливые обороты, удаляются до разбиения на слова
+    POLITE_PHRASES = (
+        "не могли бы вы", "не могли бы", "не подскажете ли", "будьте добры", "будьте любезны",
+        "заранее спасибо", "большое спасибо", "спасибо большое", "добрый день", "доброе утро",
+        "добрый вечер", "доброй ночи", "хотел бы узнать", "хотела бы узнать", "хотелось бы узнать",
+        "у меня вопрос", "у меня есть вопрос", "подскажите пожалуйста", "скажите пожалуйста",
+        "could you please", "could you", "would you please", "would you", "can you please",
+        "can you", "thank you", "thanks a lot", "good morning", "good afternoon",
+        "good evening", "i would like to know", "i want to know", "i'd like to know",
+    )
+
+    POLITE_WORDS = {
+        "здравствуйте", "здравствуй", "привет", "приветствую", "добрый", "доброе", "пожалуйста",
+        "подсказать", "рассказать", "сказать", "объяснить", "уточнить",
+        "спасибо", "благодарю", "подскажите", "подскажи", "скажите", "скажи",
+        "расскажите", "расскажи", "объясните", "объясни", "уточните", "уточни", "хотел", "хотела",
+        "хотелось", "узнать", "интересует", "вопрос", "извините", "простите",
+        "hello", "hi", "hey", "please", "thanks", "thank", "tell", "explain", "sorry",
+    }
+
+    STOPWORDS_RU = {
+        "и", "в", "во", "не", "что", "он", "на", "я", "с", "со", "как", "а", "то", "все", "она",
+        "так", "его", "но", "да", "ты", "к", "у", "же", "вы", "за", "бы", "по", "только", "ее",
+        "мне", "было", "вот", "от", "меня", "еще", "нет", "о", "об", "из", "ему",
+        "теперь", "когда", "даже", "ну", "ли", "если", "уже", "или", "ни", "быть", "был", "него",
+        "до", "вас", "нибудь", "опять", "уж", "вам", "ведь", "там", "потом", "себя", "ей",
+        "может", "они", "тут", "где", "есть", "ней", "для", "мы", "тебя", "их", "чем", "была",
+        "сам", "чтоб", "без", "чего", "раз", "тоже", "себе", "под", "будет", "ж", "тогда", "кто",
+        "этот", "того", "потому", "этого", "какой", "какая", "какие", "какое", "каких", "каков",
+        "какова", "каковы", "ним", "здесь", "этом", "почти", "мой", "тем", "чтобы", "нее",
+        "сейчас", "были", "куда", "зачем", "всех", "можно", "при", "над", "тот", "через", "эти",
+        "нас", "про", "всего", "них", "разве", "эту", "моя", "свою", "этой", "перед", "том",
+        "такой", "им", "всегда", "всю", "между", "мои", "мою", "нужно", "нужен",
+        "нужна", "нужны", "надо", "сколько", "почему", "ваш", "ваша", "ваши", "это",
+        "этих", "мог", "могу", "можете", "могли",
+    }
+
+    STOPWORDS_EN = {
+        "a", "an", "the", "and", "or", "but", "if", "of", "to", "in", "on", "at", "for", "with",
+        "by", "from", "about", "as", "is", "are", "was", "were", "be", "been", "being", "do",
+        "does", "did", "have", "has", "had", "i", "me", "my", "we", "our", "you", "your", "it",
+        "its", "this", "that", "these", "those", "what", "which", "who", "whom", "how", "when",
+        "where", "why", "can", "could", "would", "should", "will", "shall", "may", "might",
+        "there", "here", "any", "some", "so", "not", "no", "need", "know", "want", "like",
+    }
+
+    _PHRASE_RE = re.compile(
+        r"\b(?:" + "|".join(re.escape(p) for p in sorted(POLITE_PHRASES, key=len, reverse=True)) + r")\b"
+    )
+    # Слово: буквы/цифры, допускаются дефисы и точки внутри ("2-НДФЛ", "т.д.")
+    _WORD_RE = re.compile(r"[0-9a-zа-яё]+(?:[-.][0-9a-zа-яё]+)*")
+
+    def __init__(self, separator: str = " "):
+        self.separator = separator
+        self.stopwords = self.STOPWORDS_RU | self.STOPWORDS_EN | self.POLITE_WORDS
+
+    def process(self, user_query: str) -> str:
+        """Возвращает ключевые слова запроса; если ничего не осталось - исходный запрос."""
+        text = user_query.lower().replace("ё", "е")
+        text = self._PHRASE_RE.sub(" ", text)
+        words = [
+            word for word in self._WORD_RE.findall(text)
+            if word not in self.stopwords
+        ]
+        return self.separator.join(words) if words else user_query.strip()
+
+    __call__ = process
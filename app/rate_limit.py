@@ -0,0 +1,29 @@
+from threading import Lock
+import time
+
+
+class TokenBucket:
+    """Token bucket: в среднем не больше rate единиц в секунду, всплеск до burst.
+
+    reserve не блокирует, а сразу списывает единицы (баланс может уйти в минус)
+    и возвращает время, которое нужно подождать. Поэтому одно ведро можно
+    использовать и из потоков (time.sleep), и из корутин (asyncio.sleep).
+    """
+
+    def __init__(self, rate: float, burst: int):
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate и burst должны быть положительными")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def reserve(self, weight: int = 1) -> float:
+        """Резервирует weight единиц и возвращает задержку в секундах до их использования."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= weight
+            return max(0.0, -self._tokens / self.rate)
@@ -0,0 +1,106 @@
+from threading import Event, Lock, Thread
+from typing import Callable, List, Optional, Sequence, Tuple
+import time
+
+from langchain_core.documents import Document
+
+# Оценка релевантности пар (запрос, текст чанка), больше - релевантнее
+Scorer = Callable[[List[Tuple[str, str]]], Sequence[float]]
+
+
+class CrossEncoderReranker:
+    """Переранжирование найденных чанков кросс-энкодером на CPU.
+
+    Из FAISS берется fetch_k кандидатов, кросс-энкодер оценивает пары
+    (вопрос, чанк) пакетами по batch_size и оставляет лучшие top_k. Если оценка
+    не укладывается в time_budget секунд, модель еще загружается или упала,
+    возвращается исходный порядок FAISS. Бюджет проверяется перед каждым
+    пакетом, поэтому его превышение не больше времени оценки одного пакета.
+    """
+
+    # Небольшая многоязычная модель (MiniLM, 12 слоев), понимает русский
+    DEFAULT_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+    def __init__(self,
+                 model_name: str = DEFAULT_MODEL,
+                 fetch_k: int = 20,
+                 batch_size: int = 8,
+                 time_budget: float = 0.5,
+                 max_length: int = 512,
+                 scorer: Optional[Scorer] = None,
+                 warm_up_in_background: bool = True):
+        """
+        model_name - модель sentence-transformers CrossEncoder;
+        fetch_k - сколько кандидатов брать из FAISS для переранжирования;
+        time_budget - бюджет времени на оценку в секундах (None - без ограничения);
+        scorer - готовая функция оценки вместо модели (например, в бенчмарках).
+        """
+        self.model_name = model_name
+        self.fetch_k = fetch_k
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+        self.max_length = max_length
+        self._scorer = scorer
+        self._ready = Event()
+        self._lock = Lock()
+        self._error: Optional[BaseException] = None
+        if scorer is not None:
+            self._ready.set()
+        else:
+            self.start(background=warm_up_in_background)
+
+    def start(self, background: bool = True) -> None:
+        """Запускает загрузку модели (в фоне или синхронно)."""
+        if background:
+            Thread(target=self._load, name="reranker-warmup", daemon=True).start()
+        else:
+            self._load()
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._ready.is_set():
+                return
+            try:
+                from sentence_transformers import CrossEncoder
+
+                model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+                self._scorer = lambda pairs: model.predict(
+                    pairs, batch_size=self.batch_size, show_progress_bar=False
+                )
+                print(f"Модель переранжирования {self.model_name} загружена")
+            except Exception as e:
+                self._error = e
+                print(f"Не удалось загрузить модель переранжирования {self.model_name}: {e}")
+            finally:
+                self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self._scorer is not None
+
+    def rerank(self, query: str, docs: List[Document], top_k: int) -> Tuple[List[Document], str]:
+        """
+        Возвращает (лучшие top_k чанков, результат), где результат - одно из
+        "reranked", "timeout" (бюджет превышен), "not_ready" (модель не готова),
+        "error"; во всех случаях, кроме "reranked", порядок - исходный из FAISS.
+        """
+        if len(docs) <= 1:
+            return docs[:top_k], "reranked"
+        if not self.ready:
+            return docs[:top_k], "error" if self._error is not None else "not_ready"
+
+        start_time = time.perf_counter()
+        scores: List[float] = []
+        try:
+            for start in range(0, len(docs), self.batch_size):
+                if self.time_budget is not None and time.perf_counter() - start_time > self.time_budget:
+                    return docs[:top_k], "timeout"
+                batch = docs[start:start + self.batch_size]
+                scores.extend(float(score) for score in self._scorer([(query, doc.page_content) for doc in batch]))
+        except Exception as e:
+            print(f"Ошибка переранжирования: {e}")
+            return docs[:top_k], "error"
+
+        # При равных оценках сохраняется порядок FAISS
+        order = sorted(range(len(docs)), key=lambda i: (-scores[i], i))
+        return [docs[i] for i in order[:top_k]], "reranked"
@@ -0,0 +1,36 @@
+from contextlib import contextmanager
+from typing import List, Tuple
+import time
+
+
+class StartupProfile:
+    """Замер фаз запуска бота: когда фаза началась (от старта процесса) и сколько длилась.
+
+    Фазы могут идти параллельно (например, загрузка модели в фоне и запуск диспетчера).
+    """
+
+    def __init__(self, process_start: float):
+        self.process_start = process_start
+        self.phases: List[Tuple[str, float, float]] = []
+
+    def add(self, name: str, started_at: float, duration: float) -> None:
+        """Добавляет фазу по абсолютному времени начала (time.perf_counter) и длительности."""
+        self.phases.append((name, started_at - self.process_start, duration))
+
+    @contextmanager
+    def phase(self, name: str):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, started_at, time.perf_counter() - started_at)
+
+    def report(self) -> str:
+        """Печатает и возвращает сводку по фазам."""
+        lines = ["\nВремя запуска:"]
+        for name, offset, duration in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(f"   {name:<32} старт +{offset:6.2f} с   длительность {duration:6.2f} с")
+        lines.append(f"   {'всего':<32} {time.perf_counter() - self.process_start:6.2f} с")
+        text = "\n".join(lines)
+        print(text)
+        return text
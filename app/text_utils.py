@@ -1,26 +1,94 @@
 from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
 import PyPDF2
 from docx import Document
 
 class TextProcessor:
     """
     Класс для извлечения текста из файлов PDF, DOCX и TXT.
+
+    Методы iter_* возвращают генераторы блоков (номер страницы, текст), чтобы
+    разбивать документ на чанки по мере чтения, не держа весь текст в памяти.
+    Номер страницы есть только у PDF, для DOCX и TXT он равен None.
     """
 
+    # Примерный размер блока для форматов без страниц
+    BLOCK_SIZE = 64 * 1024
+
     @staticmethod
-    def extract_text_from_pdf(file_path: str) -> str:
+    def iter_pdf_pages(file_path: str) -> Iterator[Tuple[Optional[int], str]]:
         try:
             with open(file_path, "rb") as f:
                 reader = PyPDF2.PdfReader(f)
-                text = ""
-                for page in reader.pages:
+                for number, page in enumerate(reader.pages, start=1):
                     page_text = page.extract_text()
                     if page_text:
-                        text += page_text
-                return text.strip()
+                        yield number, page_text
         except Exception as e:
             print(f"Ошибка чтения PDF {file_path}: {e}")
-            return ""
+
+    @classmethod
+    def iter_docx_blocks(cls, file_path: str) -> Iterator[Tuple[Optional[int], str]]:
+        try:
+            doc = Document(file_path)
+            block, size = [], 0
+            for para in doc.paragraphs:
+                block.append(para.text)
+                size += len(para.text) + 1
+                if size >= cls.BLOCK_SIZE:
+                    yield None, "\n".join(block)
+                    block, size = [], 0
+            if block:
+                yield None, "\n".join(block)
+        except Exception as e:
+            print(f"Ошибка чтения DOCX {file_path}: {e}")
+
+    @classmethod
+    def iter_txt_blocks(cls, file_path: str) -> Iterator[Tuple[Optional[int], str]]:
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                block, size = [], 0
+                for line in f:
+                    block.append(line)
+                    size += len(line)
+                    if size >= cls.BLOCK_SIZE:
+                        yield None, "".join(block)
+                        block, size = [], 0
+                if block:
+                    yield None, "".join(block)
+        except Exception as e:
+            print(f"Ошибка чтения TXT {file_path}: {e}")
+
+    @classmethod
+    def iter_pages(cls, file_path: str) -> Iterator[Tuple[Optional[int], str]]:
+        """
+        Универсальный метод для потокового извлечения текста из файла по его расширению.
+        Пустые блоки пропускаются.
+        """
+        ext = Path(file_path).suffix.lower()
+
+        if ext == ".pdf":
+            blocks = cls.iter_pdf_pages(file_path)
+        elif ext == ".docx":
+            blocks = cls.iter_docx_blocks(file_path)
+        elif ext == ".txt":
+            blocks = cls.iter_txt_blocks(file_path)
+        else:
+            print(f"Неподдерживаемый тип файла: {ext}")
+            return
+
+        for page, text in blocks:
+            if text.strip():
+                yield page, text
+
+    @classmethod
+    def extract_pages(cls, file_path: str) -> List[Tuple[Optional[int], str]]:
+        """Список блоков (номер страницы, текст) - для передачи из пула процессов."""
+        return list(cls.iter_pages(file_path))
+
+    @classmethod
+    def extract_text_from_pdf(cls, file_path: str) -> str:
+        return "".join(text for _, text in cls.iter_pdf_pages(file_path)).strip()
 
     @staticmethod
     def extract_text_from_docx(file_path: str) -> str:
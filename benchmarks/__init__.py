@@ -0,0 +1 @@
+"""Офлайн-бенчмарки пайплайна (см. benchmarks/run.py)."""
@@ -0,0 +1,62 @@
+from typing import Dict, List
+import random
+
+# Слоги для псевдослов: корпус не зависит от внешних данных и одинаков при каждом запуске
+SYLLABLES = (
+    "ка", "ло", "ми", "ра", "то", "не", "ва", "пре", "до", "ку", "сти", "мор",
+    "гра", "ле", "зо", "ни", "ба", "по", "ры", "тел", "ска", "дин", "хо", "жу",
+)
+
+
+def make_vocabulary(size: int, rng: random.Random) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_corpus(documents: int,
+                paragraphs_per_document: int = 8,
+                sentences_per_paragraph: int = 6,
+                vocabulary_size: int = 5000,
+                seed: int = 0) -> Dict[str, str]:
+    """Генерирует синтетические документы: имя файла -> текст.
+
+    У каждого документа есть своя тема (набор частых слов), поэтому запросы,
+    составленные из его предложений, находят в первую очередь его чанки.
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size, rng)
+    corpus = {}
+    for number in range(documents):
+        topic = rng.sample(vocabulary, 20)
+        paragraphs = []
+        for _ in range(paragraphs_per_document):
+            sentences = []
+            for _ in range(sentences_per_paragraph):
+                words = [
+                    rng.choice(topic) if rng.random() < 0.4 else rng.choice(vocabulary)
+                    for _ in range(rng.randint(8, 16))
+                ]
+                sentences.append(" ".join(words).capitalize() + ".")
+            paragraphs.append(" ".join(sentences))
+        corpus[f"document_{number:05d}.txt"] = "\n\n".join(paragraphs)
+    return corpus
+
+
+def make_queries(corpus: Dict[str, str], count: int, seed: int = 1) -> List[str]:
+    """Составляет различающиеся запросы из фрагментов предложений корпуса."""
+    rng = random.Random(seed)
+    texts = list(corpus.values())
+    queries = []
+    seen = set()
+    for _ in range(count * 20):
+        if len(queries) == count:
+            break
+        words = rng.choice(texts).split()
+        start = rng.randrange(max(1, len(words) - 6))
+        query = " ".join(words[start:start + rng.randint(3, 6)]).strip(".").lower()
+        if query not in seen:
+            seen.add(query)
+            queries.append(query)
+    return queries
@@ -0,0 +1,96 @@
+from typing import Any, AsyncIterator, Iterator, List, Optional
+import asyncio
+import hashlib
+import re
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class HashEmbeddings(Embeddings):
+    """Детерминированные эмбеддинги без модели: хэширование слов в вектор размерности dim.
+
+    Слово попадает в одну из dim координат (со случайным, но воспроизводимым знаком),
+    вектор нормализуется. Тексты с общими словами получаются близкими, поэтому
+    поиск ведет себя правдоподобно, а время эмбеддинга почти не влияет на замеры.
+    """
+
+    _WORD_RE = re.compile(r"\w+")
+
+    def __init__(self, dim: int = 768):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in self._WORD_RE.findall(text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class StubChatModel(BaseChatModel):
+    """Чат-модель без сети: через latency секунд возвращает фиксированный ответ.
+
+    При потоковой генерации первая часть приходит через latency, остальные -
+    без задержки, частями по stream_chunk_size символов.
+    """
+
+    latency: float = 0.05
+    answer: str = "Ответ заглушки: информация найдена в предоставленном контексте."
+    stream_chunk_size: int = 8
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _result(self) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _parts(self) -> List[str]:
+        size = self.stream_chunk_size
+        return [self.answer[i:i + size] for i in range(0, len(self.answer), size)]
+
+    def _generate(self,
+                  messages: List[BaseMessage],
+                  stop: Optional[List[str]] = None,
+                  run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self,
+                         messages: List[BaseMessage],
+                         stop: Optional[List[str]] = None,
+                         run_manager: Any = None,
+                         **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+    def _stream(self,
+                messages: List[BaseMessage],
+                stop: Optional[List[str]] = None,
+                run_manager: Any = None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for part in self._parts():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=part))
+
+    async def _astream(self,
+                       messages: List[BaseMessage],
+                       stop: Optional[List[str]] = None,
+                       run_manager: Any = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for part in self._parts():
+            yield ChatGenerationChunk(message=AIMessageChunk(content=part))
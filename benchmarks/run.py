@@ -0,0 +1,219 @@
+"""Офлайн-бенчмарк пайплайна: загрузка документов, load_for_user и поиск.
+
+Работает без сети: LLM заменяется заглушкой с задержкой, эмбеддинги - хэшированием
+слов (или настоящей LaBSE с --embeddings labse). Результаты пишутся в JSON.
+
+    python -m benchmarks.run --sizes 50 200 1000 --top-k 1 5 20 --output bench.json
+"""
+from pathlib import Path
+from typing import Callable, Dict, List
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+from app.RAGOpenAiPipeline import RAGOpenAiPipeline
+from benchmarks.corpus import make_corpus, make_queries
+from benchmarks.fakes import HashEmbeddings, StubChatModel
+from storage.components import VectorStorage
+
+TOKEN = "bench"
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def latency_stats(values: List[float]) -> Dict[str, float]:
+    """Сводка по задержкам в миллисекундах."""
+    ms = [value * 1000 for value in values]
+    return {
+        "n": len(ms),
+        "mean_ms": statistics.fmean(ms),
+        "p50_ms": percentile(ms, 50),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": max(ms),
+    }
+
+
+def timed(fn: Callable, repeats: int) -> List[float]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def create_embeddings(kind: str):
+    if kind == "hash":
+        return HashEmbeddings()
+    return VectorStorage._create_embeddings("cointegrated/LaBSE-en-ru", "huggingface", {}, False)
+
+
+def run_size(documents: int, args, embeddings) -> dict:
+    """Все замеры для корпуса из documents документов во временной директории."""
+    corpus = make_corpus(documents, seed=args.seed)
+    queries = make_queries(corpus, args.queries, seed=args.seed + 1)
+
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as tmp:
+        files_path = Path(tmp) / "files"
+        (files_path / TOKEN).mkdir(parents=True)
+        for filename, text in corpus.items():
+            (files_path / TOKEN / filename).write_text(text, encoding="utf-8")
+
+        pipeline = RAGOpenAiPipeline(
+            files_path=str(files_path),
+            vectors_path=str(Path(tmp) / "faiss"),
+            llm=StubChatModel(latency=args.llm_latency),
+            query_preprocessor=args.query_preprocessor,
+            context_token_budget=args.context_token_budget,
+            vector_storage_kwargs={
+                "embeddings": embeddings,
+                "warm_up_in_background": False,
+                "chunk_size": args.chunk_size,
+                "chunk_overlap": args.chunk_overlap,
+                "index_factory": args.index_factory,
+                "index_promote_threshold": args.index_promote_threshold,
+            }
+        )
+        vector_store = pipeline.document_store.vector_store
+
+        start = time.perf_counter()
+        report = pipeline.load_token(TOKEN, path_to_files=str(files_path), workers=args.workers)
+        ingest_s = time.perf_counter() - start
+        chunks = report["chunks"]
+
+        def load_cold():
+            vector_store.index_cache.clear()
+            vector_store.load_for_user(TOKEN)
+
+        cold = timed(load_cold, args.repeats)
+        warm = timed(lambda: vector_store.load_for_user(TOKEN), args.repeats)
+
+        retrieval = {}
+        for top_k in args.top_k:
+            # Кэши запросов сбрасываются, чтобы мерить сам поиск, а не попадания в кэш
+            vector_store.result_cache.clear()
+            vector_store.embedding_model.cache.clear()
+            timings = []
+            for query in queries:
+                start = time.perf_counter()
+                vector_store.search(TOKEN, query, top_k)
+                timings.append(time.perf_counter() - start)
+            retrieval[f"top_k={top_k}"] = latency_stats(timings)
+
+        vector_store.result_cache.clear()
+        vector_store.embedding_model.cache.clear()
+        query_timings = []
+        for query in queries[:args.query_runs]:
+            start = time.perf_counter()
+            pipeline.query(TOKEN, query, top_k=5)
+            query_timings.append(time.perf_counter() - start)
+
+        context = {
+            name: pipeline.metrics.snapshot().get(f"rag_context_{name}", [{}])[0].get("mean")
+            for name in ("chars", "tokens")
+        }
+        pipeline.document_store.registry.close()
+
+    return {
+        "documents": documents,
+        "chunks": chunks,
+        "corpus_mb": sum(len(text.encode("utf-8")) for text in corpus.values()) / 2 ** 20,
+        "ingest": {
+            "total_s": ingest_s,
+            "documents_per_s": documents / ingest_s,
+            "chunks_per_s": chunks / ingest_s,
+            "stages": report,
+        },
+        "load_for_user": {
+            "cold": latency_stats(cold),
+            "warm": latency_stats(warm),
+        },
+        "retrieval": retrieval,
+        "query": latency_stats(query_timings),
+        "context_mean": context,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк RAG-пайплайна")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000],
+                        help="размеры корпуса в документах")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--queries", type=int, default=200, help="число запросов поиска на размер")
+    parser.add_argument("--query-runs", type=int, default=20, help="число полных запросов query")
+    parser.add_argument("--repeats", type=int, default=5, help="повторы замеров load_for_user")
+    parser.add_argument("--embeddings", choices=("hash", "labse"), default="hash")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="задержка заглушки LLM, с")
+    parser.add_argument("--query-preprocessor", choices=RAGOpenAiPipeline.QUERY_PREPROCESSORS, default="llm")
+    parser.add_argument("--context-token-budget", type=int, default=3000,
+                        help="бюджет контекста в токенах (0 - без ограничения)")
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--index-factory", default="Flat")
+    parser.add_argument("--index-promote-threshold", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="процессы для извлечения текста")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None,
+                        help="файл результатов (по умолчанию benchmarks/results/<время>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> dict:
+    args = parse_args(argv)
+    args.context_token_budget = args.context_token_budget or None
+    embeddings = create_embeddings(args.embeddings)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {key: value for key, value in vars(args).items() if key != "output"},
+        },
+        "results": [],
+    }
+    for documents in args.sizes:
+        print(f"\nБенчмарк: {documents} документов")
+        result = run_size(documents, args, embeddings)
+        results["results"].append(result)
+        print(
+            f"   загрузка {result['ingest']['total_s']:.2f} с ({result['chunks']} чанков), "
+            f"load_for_user холодный p50 {result['load_for_user']['cold']['p50_ms']:.1f} мс, "
+            f"поиск p50/p99 " + ", ".join(
+                f"{name}: {stats['p50_ms']:.1f}/{stats['p99_ms']:.1f} мс"
+                for name, stats in result["retrieval"].items()
+            )
+        )
+
+    output = Path(args.output) if args.output else (
+        Path(__file__).parent / "results" / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nРезультаты записаны в {output}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,13 @@
 from aiogram import Router
 from aiogram.enums import ParseMode
 from aiogram.filters import Command, CommandStart
-from aiogram.types import Message, FSInputFile
+from aiogram.types import Message
+import asyncio
+import itertools
 import os
 from dotenv import load_dotenv
 from app.text_utils import TextProcessor
+from handlers.delivery import send_documents
 
 load_dotenv()  # Загружаем переменные окружения
 
@@ -13,7 +16,7 @@ ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
 
 
 @router.message(Command(commands=['start']))
-async def start_handler(message: Message, user_states, pipeline):
+async def start_handler(message: Message, registry, pipeline):
     await message.answer(
         "👋 Добро пожаловать в сервис онбординга сотрудников!\n\n"
         "Для начала работы введите токен, полученный от работодателя, с помощью команды:\n"
@@ -29,14 +32,11 @@ async def start_handler(message: Message, user_states, pipeline):
 
 
 @router.message(Command(commands=['help']))
-async def help_handler(message: Message, user_states) -> None:
+async def help_handler(message: Message, registry) -> None:
     """Обработчик команды /help - вывод информации о доступных командах"""
     # Проверяем, является ли пользователь администратором
-    is_admin = False
-    if message.from_user.id in user_states:
-        user_data = user_states[message.from_user.id]
-        if isinstance(user_data, dict):
-            is_admin = user_data.get('is_admin', False)
+    user_data = registry.get_session(message.from_user.id)
+    is_admin = bool(user_data and user_data['is_admin'])
 
     # Основная информация о боте
     help_text = (
@@ -76,7 +76,7 @@ async def help_handler(message: Message, user_states) -> None:
 
 
 @router.message(Command(commands=['token']))
-async def token_handler(message: Message, user_states, pipeline) -> None:
+async def token_handler(message: Message, registry, pipeline, file_ids) -> None:
     """Обработчик команды /token с отправкой документов пользователю."""
     args = message.text.split(maxsplit=1)
     if len(args) < 2:
@@ -88,36 +88,34 @@ async def token_handler(message: Message, user_states, pipeline) -> None:
         return
 
     token = args[1].strip()
-    if token not in pipeline.document_store.list_user_tokens():
+    if not pipeline.document_store.has_token(token):
         await message.answer(
             "❌ Неверный токен. Пожалуйста, проверьте правильность введенного токена и попробуйте еще раз.\n"
             "`/token [ваш_токен]`",
             parse_mode=ParseMode.MARKDOWN
         )
-        user_states.pop(message.from_user.id, None)
+        registry.remove_session(message.from_user.id)
         return
 
     # Сохраняем токен пользователя
-    if message.from_user.id in user_states:
-        if user_states[message.from_user.id]['token'] == token:
+    user_data = registry.get_session(message.from_user.id)
+    if user_data is not None:
+        if user_data['token'] == token:
             await message.answer(
                 "❌ Данный токен уже установлен для Вас.",
                 parse_mode=ParseMode.MARKDOWN
             )
             return
         else:
-            user_states[message.from_user.id]['token'] = token
+            registry.set_session(message.from_user.id, token, user_data['is_admin'])
     else:
-        user_states[message.from_user.id] = {
-            'token': token,
-            'is_admin': False
-        }
+        registry.set_session(message.from_user.id, token, is_admin=False)
 
     # Получаем доступ к FileStorage через document_store
     file_storage = pipeline.document_store.file_store
 
     # Получаем список документов для токена
-    documents = pipeline.list_documents(token)
+    documents = await pipeline.alist_documents(token)
 
     if not documents:
         await message.answer(
@@ -134,23 +132,8 @@ async def token_handler(message: Message, user_states, pipeline) -> None:
         parse_mode=ParseMode.MARKDOWN
     )
 
-    # Отправляем каждый документ пользователю как прикрепленный файл
-    for doc_name in documents:
-        try:
-            # Получаем путь к файлу через FileStorage
-            file_path = file_storage.get_document_path(token, doc_name)
-
-            await message.answer_document(
-                document=FSInputFile(
-                    path=file_path,
-                    filename=doc_name
-                )
-            )
-
-        except FileNotFoundError:
-            await message.answer(f"⚠️ Документ {doc_name} не найден в хранилище")
-        except Exception as e:
-            await message.answer(f"⚠️ Не удалось отправить документ {doc_name}: {str(e)}")
+    # Отправляем документы медиагруппами, уже загруженные - по file_id
+    await send_documents(message, token, documents, file_storage, file_ids)
 
     # Финальное сообщение с инструкциями
     await message.answer(
@@ -165,10 +148,11 @@ async def token_handler(message: Message, user_states, pipeline) -> None:
 
 
 @router.message(Command(commands=['documents']))
-async def documents_handler(message: Message, user_states, pipeline) -> None:
+async def documents_handler(message: Message, registry, pipeline, file_ids) -> None:
     """Показывает список документов пользователя и отправляет все файлы."""
     # Проверяем, установлен ли токен
-    if message.from_user.id not in user_states:
+    user_data = registry.get_session(message.from_user.id)
+    if user_data is None:
         await message.answer(
             "⚠️ Пожалуйста, сначала установите токен с помощью команды `/token`\n\n"
             "Пример: `/token [ваш_токен]`",
@@ -176,8 +160,8 @@ async def documents_handler(message: Message, user_states, pipeline) -> None:
         )
         return
 
-    token = user_states[message.from_user.id]['token']
-    documents = pipeline.list_documents(token)
+    token = user_data['token']
+    documents = await pipeline.alist_documents(token)
 
     if not documents:
         await message.answer("Для вашего токена документы не найдены")
@@ -192,30 +176,16 @@ async def documents_handler(message: Message, user_states, pipeline) -> None:
         parse_mode=ParseMode.MARKDOWN
     )
 
-    # Отправляем каждый документ пользователю как прикрепленный файл
-    for doc_name in documents:
-        try:
-            # Получаем путь к файлу через FileStorage
-            file_path = file_storage.get_document_path(token, doc_name)
-
-            await message.answer_document(
-                document=FSInputFile(
-                    path=file_path,
-                    filename=doc_name
-                )
-            )
-
-        except FileNotFoundError:
-            await message.answer(f"⚠️ Документ {doc_name} не найден в хранилище")
-        except Exception as e:
-            await message.answer(f"⚠️ Не удалось отправить документ {doc_name}: {str(e)}")
+    # Отправляем документы медиагруппами, уже загруженные - по file_id
+    await send_documents(message, token, documents, file_storage, file_ids)
 
 
 
 @router.message(Command(commands=['admin']))
-async def admin_handler(message: Message, user_states, pipeline) -> None:
+async def admin_handler(message: Message, registry, pipeline) -> None:
     """Обработчик команды /admin для получения прав администратора."""
-    if message.from_user.id in user_states and user_states[message.from_user.id]['is_admin']:
+    user_data = registry.get_session(message.from_user.id)
+    if user_data is not None and user_data['is_admin']:
         await message.answer("🔓 Вы уже администратор")
         return
 
@@ -234,13 +204,10 @@ async def admin_handler(message: Message, user_states, pipeline) -> None:
         return
 
     # Помечаем пользователя как администратора
-    if message.from_user.id in user_states:
-        user_states[message.from_user.id]['is_admin'] = True
+    if user_data is not None:
+        registry.set_session(message.from_user.id, user_data['token'], is_admin=True)
     else:
-        user_states[message.from_user.id] = {
-            'token': 'example',
-            'is_admin': True
-        }
+        registry.set_session(message.from_user.id, 'example', is_admin=True)
 
     await message.answer(
         "🔓 Вы получили права администратора!\n\n"
@@ -254,15 +221,16 @@ async def admin_handler(message: Message, user_states, pipeline) -> None:
 
 
 @router.message(Command(commands=['revoke_admin']))
-async def revoke_admin_handler(message: Message, user_states) -> None:
+async def revoke_admin_handler(message: Message, registry) -> None:
     """Обработчик команды для снятия прав администратора с текущего пользователя"""
     # Проверяем, является ли пользователь администратором
-    if message.from_user.id not in user_states or not user_states[message.from_user.id].get('is_admin', False):
+    user_data = registry.get_session(message.from_user.id)
+    if user_data is None or not user_data['is_admin']:
         await message.answer("❌ Эта команда доступна только администраторам")
         return
 
     # Снимаем права администратора
-    user_states[message.from_user.id]['is_admin'] = False
+    registry.set_session(message.from_user.id, user_data['token'], is_admin=False)
 
     await message.answer(
         "🔒 Вы успешно сняли с себя права администратора.\n\n"
@@ -274,7 +242,7 @@ async def revoke_admin_handler(message: Message, user_states) -> None:
 
 
 @router.message(Command(commands=['info']))
-async def info_handler(message: Message, user_states, pipeline) -> None:
+async def info_handler(message: Message, registry, pipeline) -> None:
     """Обработчик команды /info - вывод информации о пользователе"""
     user_id = message.from_user.id
 
@@ -289,19 +257,14 @@ async def info_handler(message: Message, user_states, pipeline) -> None:
     }
 
     # Проверяем наличие токена
-    if user_id in user_states:
-        user_data = user_states[user_id]
-
-        # Обрабатываем как старый формат (просто токен), так и новый (словарь)
-        if isinstance(user_data, dict):
-            user_info['token'] = user_data.get('token')
-            user_info['is_admin'] = user_data.get('is_admin', False)
-        else:
-            user_info['token'] = user_data
+    user_data = registry.get_session(user_id)
+    if user_data is not None:
+        user_info['token'] = user_data['token']
+        user_info['is_admin'] = user_data['is_admin']
 
     # Получаем список документов, если есть токен
     if user_info['token']:
-        user_info['documents'] = pipeline.list_documents(user_info['token'])
+        user_info['documents'] = await pipeline.alist_documents(user_info['token'])
 
     # Формируем ответ
     response_text = "📋 <b>Информация о пользователе:</b>\n\n" + \
@@ -312,8 +275,8 @@ async def info_handler(message: Message, user_states, pipeline) -> None:
 
     # Добавляем информацию о документах
     if user_info['token']:
-        token = user_states[message.from_user.id]['token']
-        documents = pipeline.list_documents(token)
+        token = user_info['token']
+        documents = await pipeline.alist_documents(token)
 
         response_text += f"\n📂 Ваши документы:\n\n" + "\n".join(f"•  {doc}" for doc in documents)
 
@@ -327,9 +290,9 @@ async def info_handler(message: Message, user_states, pipeline) -> None:
 
 
 @router.message(Command(commands=['create_token']))
-async def create_token_handler(message: Message, user_states, pipeline) -> None:
+async def create_token_handler(message: Message, registry, pipeline) -> None:
     """Создание нового токена (только для администраторов)"""
-    user_data = user_states.get(message.from_user.id, {})
+    user_data = registry.get_session(message.from_user.id) or {}
     if not user_data.get('is_admin', False):
         await message.answer("❌ Эта команда доступна только администраторам")
         return
@@ -344,21 +307,29 @@ async def create_token_handler(message: Message, user_states, pipeline) -> None:
         return
 
     token = args[1].strip()
-    if token in pipeline.document_store.list_user_tokens():
+    if pipeline.document_store.has_token(token):
         await message.answer(f"❌ Токен `{token}` уже существует", parse_mode=ParseMode.MARKDOWN)
         return
 
-    # Создаем пустые директории для токена
-    pipeline.document_store.file_store.add_document(token, "__init__.txt", "Initial file")
-    pipeline.document_store.vector_store.load_for_user(token)
+    # Создаем пустые директории для токена и регистрируем его
+    await asyncio.to_thread(pipeline.document_store.create_token, token)
 
     await message.answer(f"✅ Токен `{token}` успешно создан", parse_mode=ParseMode.MARKDOWN)
 
 
+def _add_file_pages(document_store, token: str, file_name: str, file_path: str) -> None:
+    """Добавляет файл в хранилище, передавая его страницы в разбиение на чанки по мере чтения."""
+    pages = TextProcessor.iter_pages(file_path)
+    first_page = next(pages, None)
+    if first_page is None:
+        raise ValueError("Не удалось извлечь текст из файла")
+    document_store.add_document(token, file_name, itertools.chain([first_page], pages))
+
+
 @router.message(Command(commands=['add_file']))
-async def add_file_handler(message: Message, user_states, pipeline) -> None:
+async def add_file_handler(message: Message, registry, pipeline) -> None:
     """Добавление файла к токену (только для администраторов)"""
-    user_data = user_states.get(message.from_user.id, {})
+    user_data = registry.get_session(message.from_user.id) or {}
     if not user_data.get('is_admin', False):
         await message.answer("❌ Эта команда доступна только администраторам")
         return
@@ -393,7 +364,7 @@ async def add_file_handler(message: Message, user_states, pipeline) -> None:
         )
         return
 
-    if token not in pipeline.document_store.list_user_tokens():
+    if not pipeline.document_store.has_token(token):
         await message.answer(f"❌ Токен `{token}` не существует", parse_mode=ParseMode.MARKDOWN)
         return
 
@@ -435,12 +406,8 @@ async def add_file_handler(message: Message, user_states, pipeline) -> None:
         # Сохраняем файл
         await message.bot.download_file(file.file_path, file_path)
 
-        # Добавляем документ в хранилище
-        text = TextProcessor.extract_text(file_path)
-        if not text:
-            raise ValueError("Не удалось извлечь текст из файла")
-
-        pipeline.document_store.add_document(token, file_name, text)
+        # Добавляем документ в хранилище: страницы читаются и разбиваются на чанки по одной
+        await asyncio.to_thread(_add_file_pages, pipeline.document_store, token, file_name, file_path)
         await message.answer(f"✅ Файл `{file_name}` успешно добавлен для токена `{token}`",
                              parse_mode=ParseMode.MARKDOWN)
 
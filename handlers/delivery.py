@@ -0,0 +1,104 @@
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message, FSInputFile, InputMediaDocument
+from typing import List, Optional, Tuple
+import asyncio
+
+from app.rate_limit import TokenBucket
+from storage.components import FileIdCache
+
+# Telegram принимает в одной медиагруппе от 2 до 10 документов
+MEDIA_GROUP_SIZE = 10
+
+
+# Общий лимит бота на отправку сообщений (у Telegram около 30 сообщений в секунду).
+# Медиагруппа из N документов расходует N единиц - Telegram считает ее N сообщениями.
+send_bucket = TokenBucket(rate=25, burst=30)
+
+
+async def _with_retry(bucket: TokenBucket, weight: int, send):
+    """Выполняет отправку под ограничением частоты, при флуд-контроле ждет и повторяет один раз."""
+    await asyncio.sleep(bucket.reserve(weight))
+    try:
+        return await send()
+    except TelegramRetryAfter as e:
+        await asyncio.sleep(e.retry_after)
+        await asyncio.sleep(bucket.reserve(weight))
+        return await send()
+
+
+async def send_documents(message: Message,
+                         token: str,
+                         documents: List[str],
+                         file_storage,
+                         file_ids: FileIdCache,
+                         bucket: Optional[TokenBucket] = None) -> None:
+    """Отправляет документы токена медиагруппами по MEDIA_GROUP_SIZE, группы - параллельно.
+
+    Уже отправленные версии файлов пересылаются по file_id без загрузки с диска,
+    новые file_id запоминаются. Если группа не ушла, ее документы отправляются
+    по одному с загрузкой файла, чтобы ошибка касалась только конкретного документа.
+    """
+    bucket = bucket or send_bucket
+
+    files: List[Tuple[str, str]] = []
+    for doc_name in documents:
+        try:
+            files.append((doc_name, file_storage.get_document_path(token, doc_name)))
+        except FileNotFoundError:
+            await message.answer(f"⚠️ Документ {doc_name} не найден в хранилище")
+    if not files:
+        return
+
+    cached = await asyncio.to_thread(
+        lambda: [file_ids.get(token, doc_name, file_path) for doc_name, file_path in files]
+    )
+
+    def media(index: int):
+        doc_name, file_path = files[index]
+        return cached[index] or FSInputFile(path=file_path, filename=doc_name)
+
+    def remember(index: int, sent: Message) -> None:
+        if sent.document:
+            doc_name, file_path = files[index]
+            file_ids.put(token, doc_name, file_path, sent.document.file_id)
+
+    async def send_one(index: int, use_cache: bool = True) -> None:
+        doc_name, file_path = files[index]
+        document = media(index) if use_cache else FSInputFile(path=file_path, filename=doc_name)
+        try:
+            sent = await _with_retry(bucket, 1, lambda: message.answer_document(document=document))
+            remember(index, sent)
+        except Exception as e:
+            if use_cache and cached[index]:
+                # Сохраненный file_id мог стать недействительным - загружаем файл заново
+                file_ids.forget(token, doc_name)
+                await send_one(index, use_cache=False)
+                return
+            await message.answer(f"⚠️ Не удалось отправить документ {doc_name}: {str(e)}")
+
+    async def send_group(indices: List[int]) -> None:
+        if len(indices) == 1:
+            await send_one(indices[0])
+            return
+        try:
+            sent = await _with_retry(
+                bucket,
+                len(indices),
+                lambda: message.answer_media_group(
+                    media=[InputMediaDocument(media=media(index)) for index in indices]
+                )
+            )
+        except Exception as e:
+            print(f"Не удалось отправить медиагруппу, документы отправляются по одному: {e}")
+            for index in indices:
+                await send_one(index, use_cache=False)
+            return
+        for index, sent_message in zip(indices, sent):
+            remember(index, sent_message)
+
+    groups = [
+        list(range(start, min(start + MEDIA_GROUP_SIZE, len(files))))
+        for start in range(0, len(files), MEDIA_GROUP_SIZE)
+    ]
+    await asyncio.gather(*(send_group(indices) for indices in groups))
+    await asyncio.to_thread(file_ids.save)
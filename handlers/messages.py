@@ -1,17 +1,101 @@
 from aiogram import Router
 from aiogram import F
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.types import Message
+from typing import List
+import asyncio
+import time
 
 router = Router()
 
+# Ограничение Telegram на длину одного сообщения
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Минимальный интервал между правками сообщения (Telegram ограничивает частоту запросов в чат)
+STREAM_EDIT_INTERVAL = 1.5
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """Разбивает текст на части не длиннее limit, по возможности по переводу строки или пробелу."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip()
+    parts.append(text)
+    return parts
+
+
+class StreamingReply:
+    """Ответ, который дописывается по мере генерации правками отправленных сообщений.
+
+    Правки выполняются не чаще STREAM_EDIT_INTERVAL, при превышении лимита длины
+    продолжение отправляется новым сообщением.
+    """
+
+    PLACEHOLDER = "✍️ Печатаю ответ..."
+
+    def __init__(self, message: Message):
+        self.message = message
+        self.text = ""
+        self._sent: List[Message] = []
+        self._shown: List[str] = []
+        self._last_edit = 0.0
+
+    async def start(self) -> None:
+        self._sent.append(await self.message.answer(self.PLACEHOLDER, parse_mode=None))
+        self._shown.append(self.PLACEHOLDER)
+        self._last_edit = time.monotonic()
+
+    async def feed(self, chunk: str) -> None:
+        self.text += chunk
+        if time.monotonic() - self._last_edit >= STREAM_EDIT_INTERVAL:
+            await self._flush(parse_mode=None)
+
+    async def finish(self) -> None:
+        """Финальная отрисовка с Markdown; если разметка некорректна - обычным текстом."""
+        try:
+            await self._flush(parse_mode=ParseMode.MARKDOWN)
+        except TelegramBadRequest:
+            self._shown = [""] * len(self._shown)
+            await self._flush(parse_mode=None)
+
+    async def _flush(self, parse_mode) -> None:
+        parts = split_message(self.text) if self.text else [self.PLACEHOLDER]
+        for i, part in enumerate(parts):
+            if i < len(self._sent):
+                if self._shown[i] != part:
+                    await self._call(self._sent[i].edit_text, part, parse_mode=parse_mode)
+                    self._shown[i] = part
+            else:
+                self._sent.append(await self._call(self.message.answer, part, parse_mode=parse_mode))
+                self._shown.append(part)
+        self._last_edit = time.monotonic()
+
+    @staticmethod
+    async def _call(method, *args, **kwargs):
+        try:
+            return await method(*args, **kwargs)
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            return await method(*args, **kwargs)
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                return None
+            raise
+
 
 @router.message(F.text)
-async def message_handler(message: Message, user_states, pipeline) -> None:
+async def message_handler(message: Message, registry, pipeline) -> None:
     """Основной обработчик сообщений."""
     user_id = message.from_user.id
 
-    if user_id not in user_states:
+    user_data = registry.get_session(user_id)
+    if user_data is None:
         await message.answer(
             "⚠️ Пожалуйста, сначала установите токен с помощью команды `/token`\n\n"
             "`/token ваш_уникальный_токен`",
@@ -19,12 +103,11 @@ async def message_handler(message: Message, user_states, pipeline) -> None:
         )
         return
 
-    user_data = user_states[user_id]
-    user_token = user_data.get('token', 'example') if isinstance(user_data, dict) else user_data
+    user_token = user_data['token'] or 'example'
     user_text = message.text.strip()
 
     try:
-        documents = pipeline.list_documents(user_token)
+        documents = await pipeline.alist_documents(user_token)
 
         if not documents:
             await message.answer(
@@ -39,23 +122,22 @@ async def message_handler(message: Message, user_states, pipeline) -> None:
             action="typing"
         )
 
-        # Получаем ответ от пайплайна
-        answer = pipeline.query(
+        # Отправляем ответ пользователю по мере генерации
+        reply = StreamingReply(message)
+        await reply.start()
+        async for chunk in pipeline.astream_query(
             token=user_token,
             user_query=user_text,
-            top_k = 7
-        )
+            top_k=5,
+            user_id=user_id
+        ):
+            await reply.feed(chunk)
+        await reply.finish()
 
         print(f"\nПользователь: {message.from_user.username}")
         print(f"Токен: {user_token}")
         print(f"Вопрос: {user_text}")
-        print(f"Ответ: {answer}")
-
-        # Отправляем ответ пользователю
-        await message.answer(
-            answer,
-            parse_mode=ParseMode.MARKDOWN
-        )
+        print(f"Ответ: {reply.text}")
 
     except Exception as e:
         await message.answer(
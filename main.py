@@ -1,3 +1,7 @@
+import time
+
+PROCESS_START = time.perf_counter()
+
 import os
 
 from aiogram import Bot, Dispatcher
@@ -11,23 +15,77 @@ from app.RAGOpenAiPipeline import RAGOpenAiPipeline
 
 from handlers.commands import router as commands_router
 from handlers.messages import router as messages_router
+from app.startup import StartupProfile
+from app.metrics_export import serve_metrics, log_metrics
+from app.file_watcher import FileWatcher
+from storage.components import FileIdCache
 
 load_dotenv()
 
+startup = StartupProfile(PROCESS_START)
+startup.add("импорт модулей", PROCESS_START, time.perf_counter() - PROCESS_START)
+
+
+async def warm_up(pipeline: RAGOpenAiPipeline) -> None:
+    """Фоновый прогрев: токенизатор, ожидание модели эмбеддингов и загрузка документов токена example.
+
+    Пока он идет, бот уже принимает сообщения; запросы, которым нужна модель, ждут ее.
+    """
+    try:
+        # Токенизатор контекста при первом запуске скачивается - не в event loop
+        await asyncio.to_thread(pipeline.load_token_encoding)
+        await asyncio.to_thread(pipeline.wait_ready)
+        loader = pipeline.document_store.vector_store.embeddings_loader
+        startup.add("модель эмбеддингов (фон)", loader.started_at, loader.load_seconds)
+
+        with startup.phase("загрузка токена example"):
+            await asyncio.to_thread(pipeline.load_token, "example", path_to_files="./infrastructure/files")
+    except Exception as e:
+        print(f"Ошибка прогрева: {e}")
+    startup.report()
+
 
 async def main() -> None:
     storage = MemoryStorage()
-    user_states = {}
 
-    pipeline = RAGOpenAiPipeline(
-        vector_storage_kwargs={'chunk_size': 800, 'chunk_overlap': 200},
-        files_path="./infrastructure/files",
-        vectors_path="./infrastructure/faiss"
+    # Переранжирование кросс-энкодером включается, если задана модель
+    rerank_model = os.getenv("RERANK_MODEL")
+
+    with startup.phase("создание пайплайна"):
+        pipeline = RAGOpenAiPipeline(
+            vector_storage_kwargs={'chunk_size': 800, 'chunk_overlap': 200},
+            files_path="./infrastructure/files",
+            vectors_path="./infrastructure/faiss",
+            rerank_kwargs={"model_name": rerank_model} if rerank_model else None
+        )
+
+    # Ссылка на задачу держится до конца работы, иначе ее может собрать сборщик мусора
+    warm_up_task = asyncio.create_task(warm_up(pipeline))
+
+    # Метрики: HTTP-эндпоинт Prometheus и/или периодическая JSON-строка в логе
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        await serve_metrics(pipeline.metrics, int(metrics_port))
+    metrics_log_interval = float(os.getenv("METRICS_LOG_INTERVAL", "0"))
+    metrics_log_task = (
+        asyncio.create_task(log_metrics(pipeline.metrics, metrics_log_interval))
+        if metrics_log_interval > 0 else None
+    )
+
+    # Изменения файлов в infrastructure/files/<token> применяются к индексу автоматически
+    files_watch_interval = float(os.getenv("FILES_WATCH_INTERVAL", "0"))
+    files_watch_task = (
+        asyncio.create_task(FileWatcher(pipeline, "./infrastructure/files", files_watch_interval).run())
+        if files_watch_interval > 0 else None
     )
 
-    pipeline.load_token("example", path_to_files="./infrastructure/files")
+    # file_id отправленных документов, чтобы не загружать их в Telegram повторно
+    file_ids = FileIdCache("./infrastructure/telegram_file_ids.json")
+
+    # Сессии пользователей хранятся в реестре и переживают перезапуск
+    registry = pipeline.document_store.registry
 
-    dp = Dispatcher(storage=storage, pipeline=pipeline, user_states=user_states)
+    dp = Dispatcher(storage=storage, pipeline=pipeline, registry=registry, file_ids=file_ids)
 
     dp.include_router(commands_router)
     dp.include_router(messages_router)
@@ -37,6 +95,8 @@ async def main() -> None:
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
 
+    startup.add("готовность диспетчера", PROCESS_START, time.perf_counter() - PROCESS_START)
+
     try:
         await dp.start_polling(bot)
     except SystemExit:
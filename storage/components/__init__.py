@@ -1,2 +1,14 @@
 from .file_storage import FileStorage
-from .vector_storage import VectorStorage
\ No newline at end of file
+from .vector_storage import VectorStorage
+from .index_cache import IndexCache, IndexSnapshot
+from .document_index import DocumentIndex
+from .locks import ReadWriteLock, TokenLocks
+from .manifest import IngestManifest
+from .retrieval_cache import LRUCache, CachedQueryEmbeddings, normalize_query
+from .lexical_index import BM25Index
+from .onnx_embeddings import OnnxEmbeddings, verify_embeddings
+from .lazy_embeddings import LazyEmbeddings
+from .file_id_cache import FileIdCache
+from .registry import Registry
+from .metrics import Metrics
+from .embedding_store import EmbeddingStore
\ No newline at end of file
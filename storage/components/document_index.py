@@ -0,0 +1,78 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+from pathlib import Path
+import json
+
+
+class DocumentIndex:
+    """Индекс документов токена: имя файла -> id чанков в docstore FAISS.
+
+    Хранится рядом с файлами FAISS (documents.json), поэтому проверка наличия,
+    удаление и список документов не требуют обхода всех чанков.
+    """
+
+    FILENAME = "documents.json"
+
+    def __init__(self, entries: Optional[Dict[str, dict]] = None):
+        self._entries: Dict[str, dict] = entries or {}
+
+    @classmethod
+    def from_docstore(cls, vectordb) -> "DocumentIndex":
+        """Строит индекс обходом docstore (для индексов, созданных до его появления)."""
+        index = cls()
+        for doc_id, doc in vectordb.docstore._dict.items():
+            filename = doc.metadata.get("filename")
+            if filename is None:
+                continue
+            entry = index._entries.setdefault(filename, {"ids": [], "chunks": 0, "ingested_at": None})
+            entry["ids"].append(doc_id)
+            entry["chunks"] += 1
+        return index
+
+    @classmethod
+    def load(cls, path: Path, vectordb) -> "DocumentIndex":
+        """Читает индекс из директории токена или восстанавливает его по docstore."""
+        index_file = path / cls.FILENAME
+        if index_file.exists():
+            return cls(json.loads(index_file.read_text(encoding="utf-8")))
+        return cls.from_docstore(vectordb)
+
+    def save(self, path: Path) -> None:
+        """Сохраняет индекс в директорию токена."""
+        (path / self.FILENAME).write_text(
+            json.dumps(self._entries, ensure_ascii=False),
+            encoding="utf-8"
+        )
+
+    def add(self, filename: str, ids: List[str]) -> None:
+        """Регистрирует чанки документа."""
+        self._entries[filename] = {
+            "ids": list(ids),
+            "chunks": len(ids),
+            "ingested_at": datetime.now().isoformat(timespec="seconds")
+        }
+
+    def remove(self, filename: str) -> List[str]:
+        """Удаляет документ из индекса и возвращает id его чанков."""
+        entry = self._entries.pop(filename, None)
+        return entry["ids"] if entry else []
+
+    def chunk_ids(self, filename: str) -> List[str]:
+        entry = self._entries.get(filename)
+        return list(entry["ids"]) if entry else []
+
+    def info(self, filename: str) -> Optional[dict]:
+        """Возвращает число чанков и время добавления документа."""
+        entry = self._entries.get(filename)
+        if entry is None:
+            return None
+        return {"chunks": entry["chunks"], "ingested_at": entry["ingested_at"]}
+
+    def filenames(self) -> List[str]:
+        return list(self._entries)
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
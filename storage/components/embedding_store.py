@@ -0,0 +1,114 @@
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Sequence
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+class EmbeddingStore:
+    """Общий для всех токенов кэш эмбеддингов чанков по хэшу их текста.
+
+    Хранится на диске в виде двух файлов, в которые только дописываются записи:
+    keys.bin - sha256 текстов (по 32 байта), vectors.f32 - сплошной массив
+    float32 размера (число записей, dim), читается через memmap. В памяти
+    держится только словарь хэш -> номер строки. Эмбеддинг известного чанка
+    берется из кэша вместо прогона модели, поэтому одинаковые документы разных
+    токенов считаются один раз.
+
+    Кэш привязан к модели эмбеддингов: для каждой модели - своя директория.
+    """
+
+    KEYS_FILE = "keys.bin"
+    VECTORS_FILE = "vectors.f32"
+    META_FILE = "meta.json"
+    KEY_SIZE = 32
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.dim: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def _load(self) -> None:
+        meta_file = self.path / self.META_FILE
+        if not meta_file.exists():
+            return
+        self.dim = json.loads(meta_file.read_text(encoding="utf-8"))["dim"]
+        keys_file = self.path / self.KEYS_FILE
+        vectors_file = self.path / self.VECTORS_FILE
+        keys = keys_file.read_bytes() if keys_file.exists() else b""
+        vectors_size = vectors_file.stat().st_size if vectors_file.exists() else 0
+        row_size = self.dim * 4
+        count = min(len(keys) // self.KEY_SIZE, vectors_size // row_size)
+
+        # Запись, прерванная на середине, отбрасывается
+        if len(keys) != count * self.KEY_SIZE:
+            os.truncate(keys_file, count * self.KEY_SIZE)
+        if vectors_size != count * row_size:
+            os.truncate(vectors_file, count * row_size)
+        self._rows = {
+            keys[row * self.KEY_SIZE:(row + 1) * self.KEY_SIZE]: row
+            for row in range(count)
+        }
+
+    def _array(self) -> np.ndarray:
+        """Отображение vectors.f32 в память, обновляется после дописывания."""
+        if self._vectors is None or self._vectors.shape[0] < len(self._rows):
+            self._vectors = np.memmap(
+                self.path / self.VECTORS_FILE, dtype=np.float32, mode="r",
+                shape=(len(self._rows), self.dim)
+            )
+        return self._vectors
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Возвращает эмбеддинги текстов из кэша (None для отсутствующих)."""
+        with self._lock:
+            rows = [self._rows.get(self.key(text)) for text in texts]
+            found = [row for row in rows if row is not None]
+            self.hits += len(found)
+            self.misses += len(rows) - len(found)
+            if not found:
+                return [None] * len(rows)
+            vectors = iter(np.array(self._array()[found]))
+            return [next(vectors) if row is not None else None for row in rows]
+
+    def put_many(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]]) -> None:
+        """Дописывает эмбеддинги текстов, которых еще нет в кэше."""
+        with self._lock:
+            new = {}
+            for text, embedding in zip(texts, embeddings):
+                key = self.key(text)
+                if key not in self._rows and key not in new:
+                    new[key] = embedding
+            if not new:
+                return
+
+            vectors = np.asarray(list(new.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.path.mkdir(parents=True, exist_ok=True)
+                (self.path / self.META_FILE).write_text(json.dumps({"dim": self.dim}), encoding="utf-8")
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Размерность эмбеддингов {vectors.shape[1]} не совпадает с кэшем ({self.dim})")
+
+            # Сначала векторы, потом ключи: ключ без вектора при сбое не появится
+            with open(self.path / self.VECTORS_FILE, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self.path / self.KEYS_FILE, "ab") as f:
+                f.write(b"".join(new))
+            for key in new:
+                self._rows[key] = len(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
@@ -0,0 +1,111 @@
+from typing import Iterable, Optional
+from pathlib import Path
+import json
+import re
+
+import faiss
+import numpy as np
+
+FLAT = "Flat"
+META_FILENAME = "index.json"
+# k-means в FAISS ждет не меньше 39 векторов на центроид, иначе предупреждает
+# о нехватке данных и строит плохие кластеры
+TRAINING_POINTS_PER_CENTROID = 39
+
+
+def min_training_size(factory: str) -> int:
+    """Минимальное число векторов для обучения индекса (0 - обучение не нужно).
+
+    Центроиды IVF (nlist) и кодбуки PQ (2^bits на подпространство) обучаются
+    k-means, поэтому на каждый центроид нужно TRAINING_POINTS_PER_CENTROID векторов.
+    """
+    centroids = 0
+    ivf = re.search(r"IVF(\d+)", factory)
+    if ivf:
+        centroids = max(centroids, int(ivf.group(1)))
+    pq = re.search(r"PQ(\d+)(?:x(\d+))?", factory)
+    if pq:
+        centroids = max(centroids, 2 ** int(pq.group(2) or 8))
+    return centroids * TRAINING_POINTS_PER_CENTROID
+
+
+def reconstruct_all(index: faiss.Index) -> np.ndarray:
+    """Восстанавливает все векторы индекса (для PQ - приближенно)."""
+    if index.ntotal == 0:
+        return np.empty((0, index.d), dtype=np.float32)
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        ivf.make_direct_map()
+    except RuntimeError:
+        pass
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def build_index(factory: str, vectors: np.ndarray, template: Optional[faiss.Index] = None) -> faiss.Index:
+    """Строит индекс по фабричной строке FAISS и заполняет его векторами.
+
+    Если передан template, берется его обученная структура (квантователь, кодбуки)
+    без повторного обучения.
+    """
+    if template is not None:
+        index = faiss.clone_index(template)
+        index.reset()
+    else:
+        index = faiss.index_factory(vectors.shape[1], factory)
+    if not index.is_trained:
+        index.train(vectors)
+    if len(vectors):
+        index.add(vectors)
+    return index
+
+
+def is_flat(index: faiss.Index) -> bool:
+    return isinstance(index, faiss.IndexFlat)
+
+
+def remove_ids(vectordb, ids: Iterable[str]) -> None:
+    """Удаляет чанки из FAISS-хранилища langchain.
+
+    Для плоского индекса используется штатный delete. HNSW не поддерживает
+    удаление, а IVF при удалении не перенумеровывает оставшиеся векторы, поэтому
+    для них индекс пересобирается из оставшихся векторов с той же обученной структурой.
+    """
+    ids = set(ids)
+    if is_flat(vectordb.index):
+        vectordb.delete(list(ids))
+        return
+
+    vectors = reconstruct_all(vectordb.index)
+    keep = [
+        position for position, doc_id in sorted(vectordb.index_to_docstore_id.items())
+        if doc_id not in ids
+    ]
+    vectordb.index = build_index("", vectors[keep], template=vectordb.index)
+    vectordb.index_to_docstore_id = {
+        new_position: vectordb.index_to_docstore_id[old_position]
+        for new_position, old_position in enumerate(keep)
+    }
+    vectordb.docstore.delete(list(ids))
+
+
+def convert(vectordb, factory: str) -> None:
+    """Переводит FAISS-хранилище langchain на индекс другого типа (с обучением)."""
+    vectordb.index = build_index(factory, reconstruct_all(vectordb.index))
+
+
+def apply_search_params(index: faiss.Index, params: Optional[str]) -> None:
+    """Применяет параметры поиска, например "efSearch=64" или "nprobe=16"."""
+    if params and not is_flat(index):
+        faiss.ParameterSpace().set_index_parameters(index, params)
+
+
+def load_factory(path: Path) -> str:
+    """Возвращает тип индекса, записанный рядом с файлами FAISS."""
+    meta_file = path / META_FILENAME
+    if meta_file.exists():
+        return json.loads(meta_file.read_text(encoding="utf-8"))["factory"]
+    return FLAT
+
+
+def save_factory(path: Path, factory: str) -> None:
+    (path / META_FILENAME).write_text(json.dumps({"factory": factory}), encoding="utf-8")
@@ -0,0 +1,62 @@
+from typing import Dict, Optional
+from pathlib import Path
+from threading import Lock
+import json
+
+from .manifest import IngestManifest
+
+
+class FileIdCache:
+    """Кэш file_id Telegram для отправленных документов.
+
+    Ключ - (токен, имя файла, sha256 содержимого): пока файл не изменился, его
+    можно переслать по file_id без повторной загрузки. Хэш пересчитывается,
+    только если изменились размер или mtime файла.
+    """
+
+    def __init__(self, path: Path):
+        """Инициализирует кэш, хранящийся в указанном JSON-файле."""
+        self.path = Path(path)
+        self._lock = Lock()
+        self._entries: Dict[str, Dict[str, dict]] = (
+            json.loads(self.path.read_text(encoding="utf-8")) if self.path.exists() else {}
+        )
+
+    def _entry(self, token: str, filename: str, file_path: Path) -> dict:
+        """Возвращает запись файла с актуальными размером, mtime и хэшем."""
+        stat = file_path.stat()
+        with self._lock:
+            entry = self._entries.get(token, {}).get(filename)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry
+
+        sha256 = IngestManifest.file_sha256(file_path)
+        file_id = entry["file_id"] if entry and entry["sha256"] == sha256 else None
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256, "file_id": file_id}
+        with self._lock:
+            self._entries.setdefault(token, {})[filename] = entry
+        return entry
+
+    def get(self, token: str, filename: str, file_path: str) -> Optional[str]:
+        """Возвращает file_id текущей версии файла или None, если ее еще не отправляли."""
+        return self._entry(token, filename, Path(file_path))["file_id"]
+
+    def put(self, token: str, filename: str, file_path: str, file_id: str) -> None:
+        """Запоминает file_id, полученный от Telegram для текущей версии файла."""
+        self._entry(token, filename, Path(file_path))["file_id"] = file_id
+
+    def forget(self, token: str, filename: str) -> None:
+        """Сбрасывает file_id файла (например, если Telegram его больше не принимает)."""
+        with self._lock:
+            entry = self._entries.get(token, {}).get(filename)
+            if entry:
+                entry["file_id"] = None
+
+    def save(self) -> None:
+        """Записывает кэш на диск."""
+        with self._lock:
+            data = json.dumps(self._entries, ensure_ascii=False)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.path.with_name(self.path.name + ".tmp")
+        tmp_file.write_text(data, encoding="utf-8")
+        tmp_file.replace(self.path)
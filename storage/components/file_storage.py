@@ -13,8 +13,11 @@ class FileStorage:
         self.base_path.mkdir(parents=True, exist_ok=True)
         print(f"Файловое хранилище инициализировано в: {self.base_path}")
 
-    def add_document(self, token: str, filename: str, text: str) -> None:
-        """Сохраняет документ в файловое хранилище."""
+    def add_document(self, token: str, filename: str, text: str, overwrite: bool = False) -> None:
+        """Сохраняет документ в файловое хранилище.
+
+        Существующий файл перезаписывается только при overwrite=True.
+        """
         user_path = self.base_path / token
         user_path.mkdir(exist_ok=True)
         file_path = user_path / filename
@@ -22,6 +25,11 @@ class FileStorage:
         if not file_path.exists():
             file_path.write_text(text, encoding='utf-8')
             print("✅ файл добавлен в файловое хранилище")
+        elif overwrite:
+            tmp_path = file_path.with_name(file_path.name + ".tmp")
+            tmp_path.write_text(text, encoding='utf-8')
+            os.replace(tmp_path, file_path)
+            print("✅ файл обновлен в файловом хранилище")
         else:
             print("✅ файл уже есть в файловом хранилище")
 
@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from threading import RLock
+from typing import List, Optional, Tuple
+
+
+class IndexSnapshot:
+    """Загруженный индекс токена: FAISS + индекс документов + лексический индекс BM25.
+    После публикации не изменяется."""
+
+    def __init__(self, vectordb, documents, lexical, factory: str = "Flat", version: int = 0):
+        self.vectordb = vectordb
+        self.documents = documents
+        self.lexical = lexical
+        # Фабричная строка FAISS, по которой построен индекс ("Flat", "HNSW32", "IVF256,PQ16", ...)
+        self.factory = factory
+        # Версия индекса на диске (номер записи), растет при каждой записи
+        self.version = version
+
+
+class IndexCache:
+    """LRU-кэш загруженных в память FAISS-индексов, ключ - токен пользователя."""
+
+    def __init__(self,
+                 max_entries: int = 32,
+                 max_bytes: int = 1024 * 1024 * 1024):
+        """Инициализирует кэш с ограничением по числу индексов и суммарному объему."""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # token -> (снимок, объем, версия индекса на диске)
+        self._entries: "OrderedDict[str, Tuple[IndexSnapshot, int, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def estimate_size(snapshot: IndexSnapshot) -> int:
+        """Оценивает объем индекса в памяти: векторы + тексты чанков."""
+        vectordb = snapshot.vectordb
+        index = vectordb.index
+        size = index.ntotal * index.d * 4
+        for doc in vectordb.docstore._dict.values():
+            size += len(doc.page_content.encode("utf-8"))
+        return size
+
+    def get(self, token: str, version: int) -> Optional[IndexSnapshot]:
+        """Возвращает индекс из кэша, если он есть и не устарел относительно диска."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[2] != version:
+                if entry is not None:
+                    self._remove(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, snapshot: IndexSnapshot, version: int) -> None:
+        """Кладет индекс в кэш и вытесняет самые давно использованные записи."""
+        size = self.estimate_size(snapshot)
+        with self._lock:
+            if token in self._entries:
+                self._remove(token)
+            if size > self.max_bytes:
+                return
+            self._entries[token] = (snapshot, size, version)
+            self._total_bytes += size
+            while (len(self._entries) > self.max_entries
+                   or self._total_bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def clear(self) -> None:
+        """Полностью очищает кэш."""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def _remove(self, token: str) -> None:
+        _, size, _ = self._entries.pop(token)
+        self._total_bytes -= size
+
+    def snapshots(self) -> List[Tuple[str, IndexSnapshot]]:
+        """Возвращает загруженные индексы (токен, снимок) для сбора метрик."""
+        with self._lock:
+            return [(token, entry[0]) for token, entry in self._entries.items()]
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, token: str) -> bool:
+        return token in self._entries
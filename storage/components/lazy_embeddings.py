@@ -0,0 +1,56 @@
+from threading import Event, Thread
+from typing import Callable, List, Optional
+import time
+
+from langchain_core.embeddings import Embeddings
+
+
+class LazyEmbeddings(Embeddings):
+    """Модель эмбеддингов, загружаемая в фоновом потоке.
+
+    Пока модель грузится, вызовы embed_* ждут ее готовности, поэтому запросы,
+    пришедшие во время прогрева, встают в очередь, а не падают.
+    """
+
+    def __init__(self, factory: Callable[[], Embeddings]):
+        self._factory = factory
+        self._ready = Event()
+        self._model: Optional[Embeddings] = None
+        self._error: Optional[BaseException] = None
+        self.started_at: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+
+    def start(self, background: bool = True) -> None:
+        """Запускает загрузку модели (в фоне или синхронно)."""
+        if background:
+            Thread(target=self._load, name="embeddings-warmup", daemon=True).start()
+        else:
+            self._load()
+
+    def _load(self) -> None:
+        self.started_at = time.perf_counter()
+        try:
+            self._model = self._factory()
+        except BaseException as e:
+            self._error = e
+        finally:
+            self.load_seconds = time.perf_counter() - self.started_at
+            self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> Embeddings:
+        """Ждет окончания загрузки и возвращает модель."""
+        if not self._ready.wait(timeout):
+            raise TimeoutError("Модель эмбеддингов еще загружается")
+        if self._error is not None:
+            raise RuntimeError("Не удалось загрузить модель эмбеддингов") from self._error
+        return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.wait().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.wait().embed_query(text)
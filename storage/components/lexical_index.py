@@ -0,0 +1,119 @@
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Tuple
+from pathlib import Path
+import gzip
+import json
+import math
+import re
+
+
+class BM25Index:
+    """Инвертированный индекс BM25 по чанкам одного токена.
+
+    Дополняет векторный поиск точными совпадениями терминов: номера форм,
+    названия отделов, аббревиатуры. Обновляется инкрементально при добавлении
+    и удалении чанков. На диске хранится прямой индекс (словарь терминов +
+    пары id термина/частота для каждого чанка) в bm25.json.gz, постинги
+    восстанавливаются при загрузке.
+    """
+
+    FILENAME = "bm25.json.gz"
+
+    _WORD_RE = re.compile(r"[0-9a-zа-яё]+(?:[-.][0-9a-zа-яё]+)*")
+    # Грубый стемминг для русского и английского: обрезка длинных слов до префикса
+    STEM_LENGTH = 6
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        terms = []
+        for word in cls._WORD_RE.findall(text.lower().replace("ё", "е")):
+            if not any(ch.isdigit() for ch in word) and len(word) > cls.STEM_LENGTH:
+                word = word[:cls.STEM_LENGTH]
+            terms.append(word)
+        return terms
+
+    @classmethod
+    def from_docstore(cls, vectordb) -> "BM25Index":
+        """Строит индекс по всем чанкам docstore (для индексов, созданных до его появления)."""
+        index = cls()
+        for doc_id, doc in vectordb.docstore._dict.items():
+            index.add(doc_id, doc.page_content)
+        return index
+
+    @classmethod
+    def load(cls, path: Path, vectordb) -> "BM25Index":
+        """Читает индекс из директории токена или строит его по docstore."""
+        index_file = path / cls.FILENAME
+        if not index_file.exists():
+            return cls.from_docstore(vectordb)
+        with gzip.open(index_file, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls()
+        vocab = data["vocab"]
+        for doc_id, pairs in data["docs"].items():
+            index._insert(doc_id, {vocab[pairs[i]]: pairs[i + 1] for i in range(0, len(pairs), 2)})
+        return index
+
+    def save(self, path: Path) -> None:
+        vocab: Dict[str, int] = {}
+        docs = {}
+        for doc_id, terms in self._doc_terms.items():
+            pairs = []
+            for term, tf in terms.items():
+                pairs.append(vocab.setdefault(term, len(vocab)))
+                pairs.append(tf)
+            docs[doc_id] = pairs
+        with gzip.open(path / self.FILENAME, "wt", encoding="utf-8") as f:
+            json.dump({"vocab": list(vocab), "docs": docs}, f, ensure_ascii=False, separators=(",", ":"))
+
+    def _insert(self, doc_id: str, terms: Dict[str, int]) -> None:
+        self._doc_terms[doc_id] = terms
+        for term, tf in terms.items():
+            self._postings[term][doc_id] = tf
+        self._lengths[doc_id] = sum(terms.values())
+        self._total_length += self._lengths[doc_id]
+
+    def add(self, doc_id: str, text: str) -> None:
+        """Добавляет чанк в индекс."""
+        self._insert(doc_id, dict(Counter(self.tokenize(text))))
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        """Удаляет чанки из индекса."""
+        for doc_id in doc_ids:
+            terms = self._doc_terms.pop(doc_id, None)
+            if terms is None:
+                continue
+            for term in terms:
+                postings = self._postings[term]
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+            self._total_length -= self._lengths.pop(doc_id)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Возвращает до k пар (id чанка, оценка BM25) по убыванию оценки."""
+        n_docs = len(self._doc_terms)
+        if not n_docs:
+            return []
+        avg_length = self._total_length / n_docs
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(self.tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+from threading import Condition, Lock, RLock
+from typing import Dict
+
+
+class ReadWriteLock:
+    """Блокировка читатели/писатель с приоритетом писателя."""
+
+    def __init__(self):
+        self._cond = Condition(Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        """Разделяемый доступ: читатели не мешают друг другу."""
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        """Исключительный доступ: ждет завершения всех читателей."""
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class _TokenLock:
+    def __init__(self):
+        self.rw = ReadWriteLock()
+        self.build = RLock()
+
+
+class TokenLocks:
+    """Реестр блокировок по токенам пользователей.
+
+    shared - чтение индекса токена с диска,
+    exclusive - подмена директории индекса на диске,
+    build - сериализует писателей одного токена на время сборки нового индекса.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, _TokenLock] = {}
+        self._guard = Lock()
+
+    def _get(self, token: str) -> _TokenLock:
+        with self._guard:
+            lock = self._locks.get(token)
+            if lock is None:
+                lock = self._locks[token] = _TokenLock()
+            return lock
+
+    def shared(self, token: str):
+        return self._get(token).rw.read()
+
+    def exclusive(self, token: str):
+        return self._get(token).rw.write()
+
+    def build(self, token: str) -> RLock:
+        return self._get(token).build
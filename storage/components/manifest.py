@@ -0,0 +1,126 @@
+from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+from threading import Lock
+import hashlib
+import json
+
+
+class IngestManifest:
+    """Манифест исходных файлов токенов.
+
+    Для каждого файла хранит размер, mtime и sha256 содержимого, хэш
+    проиндексированной версии и ссылку на извлеченный текст. Это позволяет при
+    запуске пропускать неизмененные файлы без разбора PDF/DOCX.
+    """
+
+    NEW = "new"              # файл не встречался или изменился, текст нужно извлечь
+    EXTRACTED = "extracted"  # текст этой версии уже извлечен, но не проиндексирован
+    INDEXED = "indexed"      # эта версия файла уже в векторном хранилище
+
+    def __init__(self, base_path: Path):
+        """Инициализирует манифест в указанной директории."""
+        self.base_path = Path(base_path)
+        self._manifests: Dict[str, Dict[str, dict]] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def file_sha256(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _token_path(self, token: str) -> Path:
+        return self.base_path / token
+
+    def _entries(self, token: str) -> Dict[str, dict]:
+        with self._lock:
+            if token not in self._manifests:
+                manifest_file = self._token_path(token) / "manifest.json"
+                self._manifests[token] = (
+                    json.loads(manifest_file.read_text(encoding="utf-8"))
+                    if manifest_file.exists() else {}
+                )
+            return self._manifests[token]
+
+    def _refresh(self, token: str, filename: str, path: Path) -> dict:
+        """Возвращает запись файла с актуальными размером, mtime и хэшем.
+
+        Хэш пересчитывается, только если изменились размер или mtime.
+        """
+        entries = self._entries(token)
+        stat = path.stat()
+        entry = entries.get(filename)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry
+
+        sha256 = self.file_sha256(path)
+        if entry is None or entry["sha256"] != sha256:
+            entry = {"sha256": sha256, "indexed_sha256": entry["indexed_sha256"] if entry else None}
+        entry.update({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+        entries[filename] = entry
+        return entry
+
+    def status(self, token: str, filename: str, path: Path) -> str:
+        """Возвращает состояние текущей версии файла: NEW, EXTRACTED или INDEXED."""
+        entry = self._refresh(token, filename, Path(path))
+        if entry["indexed_sha256"] == entry["sha256"]:
+            return self.INDEXED
+        if self._text_path(token, entry["sha256"]).exists():
+            return self.EXTRACTED
+        return self.NEW
+
+    def is_changed(self, token: str, filename: str, path: Path) -> bool:
+        """Проверяет, отличается ли файл от проиндексированной версии."""
+        entry = self._refresh(token, filename, Path(path))
+        return entry["indexed_sha256"] is not None and entry["indexed_sha256"] != entry["sha256"]
+
+    def _text_path(self, token: str, sha256: str) -> Path:
+        return self._token_path(token) / "texts" / f"{sha256}.json"
+
+    def cached_pages(self, token: str, filename: str) -> Optional[List[Tuple[Optional[int], str]]]:
+        """Возвращает извлеченные ранее блоки (страница, текст) текущей версии файла."""
+        entry = self._entries(token).get(filename)
+        if entry is None:
+            return None
+        text_path = self._text_path(token, entry["sha256"])
+        if not text_path.exists():
+            return None
+        return [(page, text) for page, text in json.loads(text_path.read_text(encoding="utf-8"))]
+
+    def record_pages(self,
+                     token: str,
+                     filename: str,
+                     path: Path,
+                     pages: List[Tuple[Optional[int], str]]) -> None:
+        """Сохраняет извлеченные блоки (страница, текст) текущей версии файла."""
+        entry = self._refresh(token, filename, Path(path))
+        text_path = self._text_path(token, entry["sha256"])
+        text_path.parent.mkdir(parents=True, exist_ok=True)
+        text_path.write_text(json.dumps(pages, ensure_ascii=False), encoding="utf-8")
+
+    def mark_indexed(self, token: str, filename: str, path: Path) -> None:
+        """Отмечает текущую версию файла как проиндексированную."""
+        entry = self._refresh(token, filename, Path(path))
+        entry["indexed_sha256"] = entry["sha256"]
+
+    def forget(self, token: str, filename: str) -> None:
+        """Удаляет запись файла (файл удален из хранилища)."""
+        self._entries(token).pop(filename, None)
+
+    def save(self, token: str) -> None:
+        """Записывает манифест токена на диск и удаляет тексты устаревших версий."""
+        entries = self._entries(token)
+        token_path = self._token_path(token)
+        token_path.mkdir(parents=True, exist_ok=True)
+        tmp_file = token_path / "manifest.json.tmp"
+        tmp_file.write_text(json.dumps(entries, ensure_ascii=False), encoding="utf-8")
+        tmp_file.replace(token_path / "manifest.json")
+
+        live = {entry["sha256"] for entry in entries.values()}
+        texts_path = token_path / "texts"
+        if texts_path.exists():
+            for text_file in texts_path.iterdir():
+                if text_file.stem not in live:
+                    text_file.unlink(missing_ok=True)
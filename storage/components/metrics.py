@@ -0,0 +1,154 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import time
+
+# Границы гистограмм по умолчанию - длительности в секундах
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Границы для размеров (символы, токены)
+SIZE_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    """Экранирует значение метки для текстового формата Prometheus."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """Метрики процесса: счетчики, значения (gauge) и гистограммы с метками.
+
+    Отдаются в текстовом формате Prometheus (render) или словарем для
+    структурированного лога (snapshot). Тип метрики определяется первым
+    использованием (inc - счетчик, set - значение, observe - гистограмма),
+    describe задает описание и границы гистограммы заранее.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._kinds: Dict[str, str] = {}
+        self._help: Dict[str, str] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._values: Dict[str, Dict[LabelKey, object]] = {}
+        self._collectors: List[Callable[["Metrics"], None]] = []
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: Optional[Sequence[float]] = None) -> None:
+        if kind not in ("counter", "gauge", "histogram"):
+            raise ValueError(f"Неизвестный тип метрики: {kind}")
+        with self._lock:
+            self._kinds[name] = kind
+            self._help[name] = help_text
+            if buckets is not None:
+                self._buckets[name] = buckets
+
+    def add_collector(self, collector: Callable[["Metrics"], None]) -> None:
+        """Регистрирует функцию, которая обновляет значения перед выгрузкой метрик."""
+        self._collectors.append(collector)
+
+    @staticmethod
+    def _key(labels: Dict[str, object]) -> LabelKey:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def _series(self, name: str, kind: str) -> Dict[LabelKey, object]:
+        known = self._kinds.setdefault(name, kind)
+        if known != kind:
+            raise ValueError(f"Метрика {name} уже объявлена как {known}")
+        return self._values.setdefault(name, {})
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        with self._lock:
+            series = self._series(name, "counter")
+            key = self._key(labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._series(name, "gauge")[self._key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            series = self._series(name, "histogram")
+            key = self._key(labels)
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets.get(name, LATENCY_BUCKETS))
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Записывает длительность блока в гистограмму name."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, **labels)
+
+    def _collect(self) -> None:
+        for collector in self._collectors:
+            try:
+                collector(self)
+            except Exception as e:
+                print(f"Ошибка сбора метрик: {e}")
+
+    @staticmethod
+    def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = key + extra
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> str:
+        """Возвращает все метрики в текстовом формате Prometheus."""
+        self._collect()
+        lines = []
+        with self._lock:
+            for name in sorted(self._values):
+                kind = self._kinds[name]
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(self._values[name].items()):
+                    if kind != "histogram":
+                        lines.append(f"{name}{self._format_labels(key)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets + (float("inf"),), value.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{self._format_labels(key, (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{self._format_labels(key)} {value.sum}")
+                    lines.append(f"{name}_count{self._format_labels(key)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, List[dict]]:
+        """Возвращает метрики словарем: для гистограмм - число, сумма и среднее."""
+        self._collect()
+        result = {}
+        with self._lock:
+            for name, series in self._values.items():
+                rows = []
+                for key, value in series.items():
+                    row = dict(key)
+                    if isinstance(value, _Histogram):
+                        row.update(count=value.count, sum=round(value.sum, 6),
+                                   mean=round(value.sum / value.count, 6) if value.count else 0.0)
+                    else:
+                        row["value"] = value
+                    rows.append(row)
+                result[name] = rows
+        return result
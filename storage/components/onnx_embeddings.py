@@ -0,0 +1,166 @@
+from typing import List, Optional
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class OnnxEmbeddings(Embeddings):
+    """Эмбеддинги через ONNX Runtime на CPU (опционально с динамической int8-квантизацией).
+
+    При первом запуске модель HuggingFace экспортируется в ONNX и сохраняется в
+    cache_folder/onnx/<модель>. Выход совместим с HuggingFaceEmbeddings для LaBSE
+    (pooler_output + L2-нормализация); совпадение проверяется verify_embeddings.
+    Требует пакеты onnxruntime и transformers (+ torch для экспорта).
+    """
+
+    def __init__(self,
+                 model_name: str,
+                 cache_folder: str,
+                 quantize: bool = True,
+                 batch_size: int = 32,
+                 num_threads: Optional[int] = None,
+                 pooling: str = "pooler",
+                 normalize: bool = True,
+                 max_length: int = 512):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("Для embedding_backend=\"onnx\" установите onnxruntime: pip install onnxruntime") from e
+        from transformers import AutoTokenizer
+
+        if pooling not in ("pooler", "cls", "mean"):
+            raise ValueError(f"Неизвестный способ пулинга: {pooling}")
+
+        self.batch_size = batch_size
+        self.pooling = pooling
+        self.normalize = normalize
+        self.max_length = max_length
+
+        export_dir = Path(cache_folder) / "onnx" / model_name.replace("/", "--")
+        model_path = self.export(model_name, export_dir, cache_folder, quantize)
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            str(model_path),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(str(export_dir))
+
+    @staticmethod
+    def export(model_name: str, export_dir: Path, cache_folder: str, quantize: bool) -> Path:
+        """Экспортирует модель в ONNX (и квантизует), если это еще не сделано."""
+        fp32_path = export_dir / "model.onnx"
+        int8_path = export_dir / "model.int8.onnx"
+        target = int8_path if quantize else fp32_path
+        if target.exists():
+            return target
+
+        if not fp32_path.exists():
+            import torch
+            from transformers import AutoModel, AutoTokenizer
+
+            export_dir.mkdir(parents=True, exist_ok=True)
+            tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=cache_folder)
+            model = AutoModel.from_pretrained(model_name, cache_dir=cache_folder).eval()
+            sample = tokenizer(["пример текста"], return_tensors="pt")
+            inputs = ("input_ids", "attention_mask", "token_type_ids")
+            tmp_path = export_dir / "model.onnx.tmp"
+            with torch.no_grad():
+                torch.onnx.export(
+                    model,
+                    tuple(sample[name] for name in inputs),
+                    str(tmp_path),
+                    input_names=list(inputs),
+                    output_names=["last_hidden_state", "pooler_output"],
+                    dynamic_axes={
+                        **{name: {0: "batch", 1: "sequence"} for name in inputs},
+                        "last_hidden_state": {0: "batch", 1: "sequence"},
+                        "pooler_output": {0: "batch"},
+                    },
+                    opset_version=14
+                )
+            tmp_path.replace(fp32_path)
+            tokenizer.save_pretrained(str(export_dir))
+            print(f"✅ модель {model_name} экспортирована в ONNX: {fp32_path}")
+
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            tmp_path = export_dir / "model.int8.onnx.tmp"
+            quantize_dynamic(str(fp32_path), str(tmp_path), weight_type=QuantType.QInt8)
+            tmp_path.replace(int8_path)
+            print(f"✅ модель квантизована в int8: {int8_path}")
+        return target
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # Сортировка по длине уменьшает паддинг внутри пачки
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        result = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in batch],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np"
+            )
+            feed = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+            hidden, pooled = self.session.run(["last_hidden_state", "pooler_output"], feed)
+            if self.pooling == "pooler":
+                vectors = pooled
+            elif self.pooling == "cls":
+                vectors = hidden[:, 0]
+            else:
+                mask = encoded["attention_mask"][..., None].astype(np.float32)
+                vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+            for i, vector in zip(batch, vectors):
+                result[i] = vector
+        return np.stack(result).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
+
+
+VERIFY_TEXTS = (
+    "Какие документы нужны для оформления отпуска?",
+    "Сотрудник обязан соблюдать правила внутреннего трудового распорядка.",
+    "The employee handbook describes the onboarding process.",
+    "справка 2-НДФЛ, форма Т-2",
+)
+
+
+def verify_embeddings(candidate: Embeddings,
+                      reference: Embeddings,
+                      texts=VERIFY_TEXTS,
+                      min_cosine: float = 0.99) -> float:
+    """Сравнивает эмбеддинги двух бэкендов и возвращает минимальное косинусное сходство.
+
+    Бросает ValueError, если сходство хотя бы одного текста ниже min_cosine
+    (например, при неверном пулинге или слишком грубой квантизации).
+    """
+    a = np.asarray(candidate.embed_documents(list(texts)), dtype=np.float32)
+    b = np.asarray(reference.embed_documents(list(texts)), dtype=np.float32)
+    if a.shape != b.shape:
+        raise ValueError(f"Размерности эмбеддингов не совпадают: {a.shape} и {b.shape}")
+    a /= np.clip(np.linalg.norm(a, axis=1, keepdims=True), 1e-12, None)
+    b /= np.clip(np.linalg.norm(b, axis=1, keepdims=True), 1e-12, None)
+    similarity = float((a * b).sum(axis=1).min())
+    if similarity < min_cosine:
+        raise ValueError(
+            f"Эмбеддинги расходятся с эталоном: минимальное косинусное сходство "
+            f"{similarity:.4f} < {min_cosine}"
+        )
+    return similarity
@@ -0,0 +1,133 @@
+from typing import Dict, List, Optional
+from pathlib import Path
+from threading import Lock
+import sqlite3
+
+
+class Registry:
+    """Реестр токенов, их документов (с числом чанков) и привязок пользователей к токенам.
+
+    Данные хранятся в SQLite, а все чтения идут из словарей в памяти, которые
+    загружаются при старте и обновляются после каждой успешной записи в базу
+    (write-through). Поэтому проверка токена и список документов не обходят
+    файловую систему, а сессии пользователей переживают перезапуск бота.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tokens (
+            token TEXT PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS documents (
+            token TEXT NOT NULL REFERENCES tokens(token) ON DELETE CASCADE,
+            filename TEXT NOT NULL,
+            chunks INTEGER NOT NULL,
+            PRIMARY KEY (token, filename)
+        );
+        CREATE TABLE IF NOT EXISTS sessions (
+            user_id INTEGER PRIMARY KEY,
+            token TEXT,
+            is_admin INTEGER NOT NULL DEFAULT 0
+        );
+    """
+
+    def __init__(self, path: Path):
+        """Открывает (или создает) базу реестра и загружает ее в память."""
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(self.SCHEMA)
+
+        self._documents: Dict[str, Dict[str, int]] = {
+            token: {} for (token,) in self._conn.execute("SELECT token FROM tokens")
+        }
+        for token, filename, chunks in self._conn.execute("SELECT token, filename, chunks FROM documents"):
+            self._documents[token][filename] = chunks
+        self._sessions: Dict[int, dict] = {
+            user_id: {"token": token, "is_admin": bool(is_admin)}
+            for user_id, token, is_admin in self._conn.execute("SELECT user_id, token, is_admin FROM sessions")
+        }
+
+    def _write(self, sql: str, params=()) -> None:
+        """Выполняет запись в отдельной транзакции (вызывается под self._lock)."""
+        with self._conn:
+            self._conn.execute(sql, params)
+
+    # Токены и документы
+
+    def is_empty(self) -> bool:
+        return not self._documents
+
+    def has_token(self, token: str) -> bool:
+        return token in self._documents
+
+    def list_tokens(self) -> List[str]:
+        return list(self._documents)
+
+    def add_token(self, token: str) -> None:
+        with self._lock:
+            if token in self._documents:
+                return
+            self._write("INSERT OR IGNORE INTO tokens (token) VALUES (?)", (token,))
+            self._documents[token] = {}
+
+    def list_documents(self, token: str) -> List[str]:
+        return list(self._documents.get(token, {}))
+
+    def set_document(self, token: str, filename: str, chunks: int) -> None:
+        """Регистрирует документ токена (токен создается при необходимости)."""
+        self.add_token(token)
+        with self._lock:
+            self._write(
+                "INSERT INTO documents (token, filename, chunks) VALUES (?, ?, ?) "
+                "ON CONFLICT (token, filename) DO UPDATE SET chunks = excluded.chunks",
+                (token, filename, chunks)
+            )
+            self._documents[token][filename] = chunks
+
+    def remove_document(self, token: str, filename: str) -> None:
+        with self._lock:
+            self._write("DELETE FROM documents WHERE token = ? AND filename = ?", (token, filename))
+            self._documents.get(token, {}).pop(filename, None)
+
+    def replace_all(self, documents: Dict[str, Dict[str, int]]) -> None:
+        """Полностью заменяет токены и документы (синхронизация с хранилищами)."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM documents")
+                self._conn.execute("DELETE FROM tokens")
+                self._conn.executemany("INSERT INTO tokens (token) VALUES (?)", [(t,) for t in documents])
+                self._conn.executemany(
+                    "INSERT INTO documents (token, filename, chunks) VALUES (?, ?, ?)",
+                    [(token, filename, chunks)
+                     for token, files in documents.items()
+                     for filename, chunks in files.items()]
+                )
+            self._documents = {token: dict(files) for token, files in documents.items()}
+
+    # Сессии пользователей
+
+    def get_session(self, user_id: int) -> Optional[dict]:
+        """Возвращает копию сессии пользователя: {"token": ..., "is_admin": ...} или None."""
+        session = self._sessions.get(user_id)
+        return dict(session) if session else None
+
+    def set_session(self, user_id: int, token: Optional[str], is_admin: bool = False) -> None:
+        with self._lock:
+            self._write(
+                "INSERT INTO sessions (user_id, token, is_admin) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET token = excluded.token, is_admin = excluded.is_admin",
+                (user_id, token, int(is_admin))
+            )
+            self._sessions[user_id] = {"token": token, "is_admin": is_admin}
+
+    def remove_session(self, user_id: int) -> None:
+        with self._lock:
+            self._write("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+            self._sessions.pop(user_id, None)
+
+    def close(self) -> None:
+        self._conn.close()
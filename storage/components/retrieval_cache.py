@@ -0,0 +1,77 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable, List, Optional
+import re
+
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_query(text: str) -> str:
+    """Нормализует запрос для ключа кэша: регистр и пробелы не важны."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш с ограничением по числу записей."""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, predicate) -> None:
+        """Удаляет записи, ключ которых удовлетворяет условию."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Обертка над моделью эмбеддингов с LRU-кэшем эмбеддингов запросов.
+
+    Ключ - нормализованный текст запроса, а эмбеддинг считается по исходному
+    тексту: модель различает регистр, и чанки документов эмбеддились как есть.
+    Эмбеддинги документов не кэшируются.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_size: int = 1024):
+        self.embeddings = embeddings
+        self.cache = LRUCache(max_size)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(key, vector)
+        return vector
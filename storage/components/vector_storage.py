@@ -1,102 +1,687 @@
-from typing import Optional, List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from pathlib import Path
+from threading import Lock
+import numpy as np
+import hashlib
+import json
+import re
+import shutil
+import time
+import uuid
+import os
+
+from .index_cache import IndexCache, IndexSnapshot
+from .document_index import DocumentIndex
+from .locks import TokenLocks
+from .lexical_index import BM25Index
+from .faiss_index import (
+    FLAT, apply_search_params, convert, load_factory, min_training_size, remove_ids, save_factory
+)
+from .lazy_embeddings import LazyEmbeddings
+from .embedding_store import EmbeddingStore
+from .metrics import Metrics
+from .retrieval_cache import CachedQueryEmbeddings, LRUCache, normalize_query
+
+# Текст документа: строка целиком или поток блоков (номер страницы или None, текст)
+TextSource = Union[str, Iterable[Tuple[Optional[int], str]]]
 
 
 class VectorStorage:
-    """Векторное хранилище документов (FAISS)."""
+    """Векторное хранилище документов (FAISS).
+
+    Индекс каждого токена - неизменяемый снимок: читатели получают ссылку на
+    загруженный индекс и работают с ней без блокировок, а запись собирает новый
+    индекс в отдельной директории версии и атомарно переключает на нее указатель.
+
+    Директория токена: файл CURRENT с именем текущей версии и директории версий.
+    Указатель заменяется одним os.replace, поэтому после сбоя на диске остается
+    либо старая, либо новая версия целиком; остальные версии удаляются. Имя
+    версии начинается с номера записи, который растет на 1 при каждой записи
+    и служит версией индекса для кэшей результатов поиска и ответов.
+    """
+
+    POINTER_FILE = "CURRENT"
+    # Старая схема записи переносила сюда текущий индекс на время подмены
+    STAGING_DIR = ".staging"
+    EMBEDDINGS_DIR = ".embeddings"
 
     def __init__(self,
                  base_path: str,
                  embedding_model: str = "cointegrated/LaBSE-en-ru",
+                 embedding_backend: str = "huggingface",
+                 embedding_backend_kwargs: Optional[dict] = None,
+                 verify_embedding_backend: bool = False,
+                 embeddings: Optional[Embeddings] = None,
+                 warm_up_in_background: bool = True,
                  chunk_size: int = 600,
-                 chunk_overlap: int = 200):
-        """Инициализирует хранилище с указанными параметрами."""
+                 chunk_overlap: int = 200,
+                 embedding_batch_size: int = 256,
+                 shared_embedding_cache: bool = True,
+                 embedding_cache_namespace: Optional[str] = None,
+                 query_cache_size: int = 1024,
+                 result_cache_size: int = 1024,
+                 hybrid_search: bool = True,
+                 fusion_fetch_factor: int = 4,
+                 rrf_k: int = 60,
+                 index_factory: str = FLAT,
+                 index_promote_threshold: int = 0,
+                 index_search_params: Optional[str] = None,
+                 cache_max_entries: int = 32,
+                 cache_max_bytes: int = 1024 * 1024 * 1024,
+                 metrics: Optional[Metrics] = None):
+        """Инициализирует хранилище с указанными параметрами.
+
+        index_factory - тип FAISS-индекса в синтаксисе faiss.index_factory: "Flat"
+        (точный поиск), "HNSW32", "IVF256,Flat", "IVF256,PQ16" и т.д. Новые токены
+        начинают с плоского индекса и переводятся на index_factory, когда число
+        чанков достигает index_promote_threshold (и объема, нужного для обучения).
+        index_search_params - параметры поиска, например "efSearch=64" или "nprobe=16".
+
+        embedding_backend - "huggingface" (sentence-transformers, fp32 PyTorch) или
+        "onnx" (ONNX Runtime, см. OnnxEmbeddings; необязательная зависимость, не входит
+        в requirements.txt: pip install onnxruntime; embedding_backend_kwargs передаются
+        в него: quantize, batch_size, num_threads, ...). verify_embedding_backend
+        сравнивает ONNX-эмбеддинги с эталонными при запуске. Готовая модель,
+        переданная в embeddings (например, детерминированная в бенчмарках),
+        используется вместо них.
+
+        shared_embedding_cache - кэшировать эмбеддинги чанков на диске по хэшу
+        текста, общим для всех токенов (см. EmbeddingStore): одинаковые документы
+        разных токенов проходят через модель один раз. Директория кэша своя для
+        каждой модели (имя, бэкенд и его настройки) и размерности эмбеддингов;
+        для готовой модели из embeddings стоит задать embedding_cache_namespace,
+        иначе различаются только класс модели и размерность.
+
+        warm_up_in_background - загружать модель эмбеддингов в фоновом потоке;
+        операции, которым нужна модель, ждут окончания загрузки (см. wait_ready).
+
+        metrics - куда записывать длительности этапов (загрузка индекса, эмбеддинг,
+        поиск, разбиение, запись), обращения к кэшам и размеры индексов.
+        """
         self.base_path = Path(base_path) if base_path else (
                 Path(__file__).parents[3] / "infrastructure" / "faiss"
         )
-        self.embedding_model = HuggingFaceEmbeddings(
-            model_name=embedding_model,
-            cache_folder=str(Path(__file__).parents[2] / "infrastructure" / "embeddings")
+        self.embeddings_loader = LazyEmbeddings(lambda: embeddings or self._create_embeddings(
+            embedding_model,
+            embedding_backend,
+            embedding_backend_kwargs or {},
+            verify_embedding_backend
+        ))
+        self.embeddings_loader.start(background=warm_up_in_background)
+        self.embedding_model = CachedQueryEmbeddings(
+            self.embeddings_loader,
+            max_size=query_cache_size
         )
+        # start_index (вместе с номером блока в _split) позволяет склеивать
+        # перекрывающиеся чанки при сборке контекста
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap
+            chunk_overlap=chunk_overlap,
+            add_start_index=True
         )
-        self.vectordb: Optional[FAISS] = None
+        self.embedding_batch_size = embedding_batch_size
+        # Кэш эмбеддингов чанков открывается при первой загрузке документов,
+        # когда известна размерность модели (см. _chunk_embedding_store)
+        self._embedding_cache_namespace = self._embeddings_namespace(
+            embedding_model, embedding_backend, embedding_backend_kwargs, embeddings, embedding_cache_namespace
+        ) if shared_embedding_cache else None
+        self.embedding_store: Optional[EmbeddingStore] = None
+        self._embedding_store_lock = Lock()
+        # Гибридный поиск: FAISS + BM25, объединение по reciprocal rank fusion
+        self.hybrid_search = hybrid_search
+        self.fusion_fetch_factor = fusion_fetch_factor
+        self.rrf_k = rrf_k
+        self.index_factory = index_factory
+        self.index_promote_threshold = index_promote_threshold
+        self.index_search_params = index_search_params
+        self.index_cache = IndexCache(
+            max_entries=cache_max_entries,
+            max_bytes=cache_max_bytes
+        )
+        # (token, нормализованный запрос, top_k, версия индекса) -> найденные чанки
+        self.result_cache = LRUCache(result_cache_size)
+        self._locks = TokenLocks()
+        self.metrics = metrics or Metrics()
+        self._describe_metrics()
+        self._recover()
         print(f"Векторное хранилище инициализировано в: {self.base_path}")
 
-    def load_for_user(self, token: str) -> None:
-        """Загружает или создает хранилище для пользователя."""
-        user_path = self.base_path / token
+    def _recover(self) -> None:
+        """Убирает остатки прерванных записей индексов.
 
-        if user_path.exists():
-            self.vectordb = FAISS.load_local(
-                folder_path=str(user_path),
-                embeddings=self.embedding_model,
-                allow_dangerous_deserialization=True
-            )
+        Индекс, который старая схема записи перенесла в .staging и не успела
+        заменить новым, возвращается на место, если у токена нет текущего индекса.
+        """
+        staging = self.base_path / self.STAGING_DIR
+        if staging.exists():
+            for path in sorted(staging.iterdir(), key=lambda p: p.stat().st_mtime_ns, reverse=True):
+                token = path.name.rsplit("-", 1)[0]
+                if (path.name.endswith(".old") and (path / "index.faiss").exists()
+                        and self._live_path(token) is None):
+                    user_path = self.base_path / token
+                    if user_path.exists():
+                        shutil.rmtree(user_path)
+                    os.replace(path, user_path)
+                    print(f"Индекс токена {token} восстановлен после прерванной записи")
+                else:
+                    shutil.rmtree(path, ignore_errors=True)
+            shutil.rmtree(staging, ignore_errors=True)
+        for token in self.list_user_tokens():
+            self._remove_stale_versions(self.base_path / token)
+
+    def _describe_metrics(self) -> None:
+        self.metrics.describe("rag_stage_seconds", "histogram", "Длительность этапов запроса и загрузки документов")
+        self.metrics.describe("rag_cache_requests_total", "counter", "Обращения к кэшам (result=hit|miss)")
+        self.metrics.describe("rag_ingested_chunks_total", "counter", "Добавлено чанков в индекс")
+        self.metrics.describe("rag_index_chunks", "gauge", "Чанков в загруженном индексе токена")
+        self.metrics.describe("rag_index_documents", "gauge", "Документов в загруженном индексе токена")
+        self.metrics.describe("rag_cache_entries", "gauge", "Записей в кэше")
+        self.metrics.describe("rag_cache_hit_ratio", "gauge", "Доля попаданий в кэш с момента запуска")
+        self.metrics.describe("rag_index_cache_bytes", "gauge", "Оценка объема загруженных индексов в памяти")
+        self.metrics.add_collector(self._collect_metrics)
+
+    def _collect_metrics(self, metrics: Metrics) -> None:
+        """Обновляет размеры индексов и состояние кэшей перед выгрузкой метрик."""
+        for token, snapshot in self.index_cache.snapshots():
+            metrics.set("rag_index_chunks", snapshot.vectordb.index.ntotal, token=token)
+            metrics.set("rag_index_documents", len(snapshot.documents), token=token)
+        metrics.set("rag_index_cache_bytes", self.index_cache.total_bytes)
+        for name, cache in (("index", self.index_cache),
+                            ("result", self.result_cache),
+                            ("query_embedding", self.embedding_model.cache),
+                            ("chunk_embedding", self.embedding_store)):
+            if cache is None:
+                continue
+            metrics.set("rag_cache_entries", len(cache), cache=name)
+            requests = cache.hits + cache.misses
+            metrics.set("rag_cache_hit_ratio", cache.hits / requests if requests else 0.0, cache=name)
+
+    def _observe_ingest(self, token: str, report: Dict[str, float]) -> None:
+        """Записывает в метрики длительности этапов загрузки документов из отчета."""
+        for stage in ("chunking", "embedding", "persist"):
+            if f"{stage}_s" in report:
+                self.metrics.observe("rag_stage_seconds", report[f"{stage}_s"],
+                                     operation="ingest", stage=stage, token=token)
+        self.metrics.inc("rag_ingested_chunks_total", report.get("chunks", 0), token=token)
+
+    EMBEDDING_BACKENDS = ("huggingface", "onnx")
+
+    @staticmethod
+    def _embeddings_namespace(model_name: str,
+                              backend: str,
+                              backend_kwargs: Optional[dict],
+                              embeddings: Optional[Embeddings],
+                              namespace: Optional[str] = None) -> str:
+        """Имя директории кэша эмбеддингов чанков: свое для каждой модели и ее настроек."""
+        if namespace is not None:
+            name = spec = namespace
+        elif embeddings is not None:
+            name = type(embeddings).__name__
+            spec = f"{type(embeddings).__module__}.{type(embeddings).__qualname__}"
         else:
-            doc = self.text_splitter.create_documents(["init"])[0]
-            doc.metadata = {"token": token, "filename": "__init__"}
-            self.vectordb = FAISS.from_documents([doc], self.embedding_model)
-            self.vectordb.save_local(str(user_path))
-
-    def add_document(self, token: str, filename: str, text: str) -> None:
-        """Добавляет документ в хранилище."""
-        self.load_for_user(token)
-        if self._document_exists(token, filename):
-            print("✅ файл уже есть в векторном хранилище")
+            name = model_name
+            spec = json.dumps([model_name, backend, backend_kwargs or {}], sort_keys=True, default=str)
+        slug = re.sub(r"[^\w.-]+", "_", name)
+        return f"{slug}-{hashlib.sha1(spec.encode('utf-8')).hexdigest()[:8]}"
+
+    @classmethod
+    def _create_embeddings(cls,
+                           model_name: str,
+                           backend: str,
+                           backend_kwargs: dict,
+                           verify: bool) -> Embeddings:
+        """Создает модель эмбеддингов выбранного бэкенда."""
+        if backend not in cls.EMBEDDING_BACKENDS:
+            raise ValueError(f"Неизвестный бэкенд эмбеддингов: {backend}")
+
+        cache_folder = str(Path(__file__).parents[2] / "infrastructure" / "embeddings")
+        reference = None
+        if backend == "huggingface" or verify:
+            from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+            reference = HuggingFaceEmbeddings(
+                model_name=model_name,
+                cache_folder=cache_folder
+            )
+        if backend == "huggingface":
+            return reference
+
+        from .onnx_embeddings import OnnxEmbeddings, verify_embeddings
+
+        embeddings = OnnxEmbeddings(model_name, cache_folder, **backend_kwargs)
+        if verify:
+            similarity = verify_embeddings(embeddings, reference)
+            print(f"✅ ONNX-эмбеддинги совпадают с эталоном (мин. косинус {similarity:.4f})")
+        return embeddings
+
+    def wait_ready(self, timeout: Optional[float] = None) -> None:
+        """Ждет окончания фоновой загрузки модели эмбеддингов."""
+        self.embeddings_loader.wait(timeout)
+
+    def load_for_user(self, token: str) -> FAISS:
+        """Возвращает индекс пользователя, при необходимости создавая его."""
+        return self._snapshot(token).vectordb
+
+    def _live_path(self, token: str) -> Optional[Path]:
+        """Директория текущей версии индекса токена (None, если индекса нет)."""
+        user_path = self.base_path / token
+        try:
+            return user_path / (user_path / self.POINTER_FILE).read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            # Индекс, записанный до появления указателя, лежит прямо в директории токена
+            return user_path if (user_path / "index.faiss").exists() else None
+
+    def _version(self, live_path: Optional[Path]) -> int:
+        """Номер записи индекса по имени директории версии (0 - индекса нет или он без указателя)."""
+        if live_path is None or live_path.parent == self.base_path or "-" not in live_path.name:
+            return 0
+        return int(live_path.name.split("-", 1)[0])
+
+    def _remove_stale_versions(self, user_path: Path) -> None:
+        """Удаляет из директории токена все, кроме указателя и текущей версии."""
+        live_path = self._live_path(user_path.name)
+        if live_path is None or live_path == user_path:
             return
+        for path in user_path.iterdir():
+            if path.name in (self.POINTER_FILE, live_path.name):
+                continue
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
 
-        docs = self.text_splitter.create_documents([text])
-        for doc in docs:
-            doc.metadata.update({"token": token, "filename": filename})
+    def _snapshot(self, token: str) -> IndexSnapshot:
+        """Возвращает неизменяемый снимок индекса токена (из кэша или с диска)."""
+        with self._locks.shared(token):
+            live_path = self._live_path(token)
+            if live_path is not None:
+                version = self._version(live_path)
+                cached = self.index_cache.get(token, version)
+                if cached is not None:
+                    self.metrics.inc("rag_cache_requests_total", cache="index", result="hit", token=token)
+                    return cached
+                self.metrics.inc("rag_cache_requests_total", cache="index", result="miss", token=token)
+                with self.metrics.timer("rag_stage_seconds", operation="query", stage="index_load", token=token):
+                    snapshot = self._read_snapshot(live_path)
+                snapshot.version = version
+                self.index_cache.put(token, snapshot, version)
+                return snapshot
 
-        self.vectordb.add_documents(documents=docs)
-        self.vectordb.save_local(str(self.base_path / token))
-        print("✅ файл добавлен в векторное хранилище")
+        with self._locks.build(token):
+            if self._live_path(token) is not None:
+                return self._snapshot(token)
+            snapshot = self._create_snapshot(token)
+            self._commit(token, snapshot)
+            return snapshot
 
-    def _document_exists(self, token: str, filename: str) -> bool:
-        """Проверяет наличие документа в хранилище."""
-        if not self.vectordb:
-            return False
-        return any(
-            doc.metadata.get("filename") == filename
-            for doc in self.vectordb.docstore._dict.values()
+    def _read_snapshot(self, path: Path) -> IndexSnapshot:
+        """Читает индекс с диска в новый независимый объект."""
+        vectordb = FAISS.load_local(
+            folder_path=str(path),
+            embeddings=self.embedding_model,
+            allow_dangerous_deserialization=True
+        )
+        apply_search_params(vectordb.index, self.index_search_params)
+        return IndexSnapshot(
+            vectordb,
+            DocumentIndex.load(path, vectordb),
+            BM25Index.load(path, vectordb),
+            factory=load_factory(path)
         )
 
+    def _create_snapshot(self, token: str) -> IndexSnapshot:
+        """Создает индекс с одним служебным чанком."""
+        doc = self.text_splitter.create_documents(["init"])[0]
+        doc.metadata = {"token": token, "filename": "__init__"}
+        vectordb = FAISS.from_documents([doc], self.embedding_model)
+        return IndexSnapshot(
+            vectordb,
+            DocumentIndex.from_docstore(vectordb),
+            BM25Index.from_docstore(vectordb)
+        )
+
+    def _writable_copy(self, token: str) -> IndexSnapshot:
+        """Возвращает копию индекса, которую можно изменять, не затрагивая читателей."""
+        with self._locks.shared(token):
+            live_path = self._live_path(token)
+            if live_path is not None:
+                return self._read_snapshot(live_path)
+        return self._create_snapshot(token)
+
+    def _commit(self, token: str, snapshot: IndexSnapshot) -> None:
+        """Сохраняет индекс в новую директорию версии и атомарно переключает на нее указатель.
+
+        Вызывается под self._locks.build(token).
+        """
+        user_path = self.base_path / token
+        # Номер записи, а не mtime файлов: при грубом разрешении mtime две записи
+        # подряд могли получить одну версию, и кэши отдавали бы устаревшие ответы
+        version = self._version(self._live_path(token)) + 1
+        version_path = user_path / f"{version:08d}-{uuid.uuid4().hex[:8]}"
+        snapshot.vectordb.save_local(str(version_path))
+        snapshot.documents.save(version_path)
+        snapshot.lexical.save(version_path)
+        save_factory(version_path, snapshot.factory)
+        pointer_tmp = user_path / f"{self.POINTER_FILE}.tmp"
+        pointer_tmp.write_text(version_path.name, encoding="utf-8")
+
+        with self._locks.exclusive(token):
+            os.replace(pointer_tmp, user_path / self.POINTER_FILE)
+            snapshot.version = version
+            self.index_cache.put(token, snapshot, version)
+        self.result_cache.invalidate(lambda key: key[0] == token)
+        # Читатели старой версии закончили до переключения (exclusive)
+        self._remove_stale_versions(user_path)
+
+    def _maybe_promote(self, snapshot: IndexSnapshot) -> None:
+        """Переводит плоский индекс на index_factory, когда число чанков достигает порога.
+
+        Порог - index_promote_threshold, но не меньше объема, нужного для обучения
+        IVF/PQ. Выбранный тип сохраняется вместе с индексом (index.json).
+        """
+        if snapshot.factory != FLAT or self.index_factory == FLAT:
+            return
+        threshold = max(self.index_promote_threshold, min_training_size(self.index_factory))
+        if snapshot.vectordb.index.ntotal < threshold:
+            return
+        start_time = time.perf_counter()
+        convert(snapshot.vectordb, self.index_factory)
+        apply_search_params(snapshot.vectordb.index, self.index_search_params)
+        snapshot.factory = self.index_factory
+        print(f"✅ индекс переведен на {self.index_factory} "
+              f"({snapshot.vectordb.index.ntotal} чанков, {time.perf_counter() - start_time:.2f} с)")
+
+    def _split(self, token: str, filename: str, source: TextSource) -> Iterator[Document]:
+        """Разбивает текст или поток блоков (страница, текст) на чанки по мере чтения."""
+        blocks = [(None, source)] if isinstance(source, str) else source
+        for block, (page, text) in enumerate(blocks):
+            metadata = {"token": token, "filename": filename, "block": block}
+            if page is not None:
+                metadata["page"] = page
+            yield from self.text_splitter.create_documents([text], metadatas=[metadata])
+
+    def _embed_into(self,
+                    snapshot: IndexSnapshot,
+                    chunks: Iterable[Document],
+                    report: Dict[str, float]) -> Dict[str, List[str]]:
+        """Считает эмбеддинги чанков пачками по embedding_batch_size и добавляет их в индекс.
+
+        В памяти одновременно находится не больше одной пачки эмбеддингов.
+        Возвращает id добавленных чанков по файлам.
+        """
+        file_ids: Dict[str, List[str]] = {}
+        batch: List[Document] = []
+
+        def flush():
+            start_time = time.perf_counter()
+            embeddings = self._embed_documents(batch[0].metadata["token"], [doc.page_content for doc in batch], report)
+            report["embedding_s"] += time.perf_counter() - start_time
+            ids = [str(uuid.uuid4()) for _ in batch]
+            snapshot.vectordb.add_embeddings(
+                text_embeddings=list(zip((doc.page_content for doc in batch), embeddings)),
+                metadatas=[doc.metadata for doc in batch],
+                ids=ids
+            )
+            for doc, doc_id in zip(batch, ids):
+                file_ids.setdefault(doc.metadata["filename"], []).append(doc_id)
+                snapshot.lexical.add(doc_id, doc.page_content)
+            report["chunks"] += len(batch)
+            batch.clear()
+
+        report.setdefault("chunks", 0)
+        report.setdefault("cached_chunks", 0)
+        report.setdefault("embedding_s", 0.0)
+        for doc in chunks:
+            batch.append(doc)
+            if len(batch) >= self.embedding_batch_size:
+                flush()
+        if batch:
+            flush()
+        return file_ids
+
+    def _chunk_embedding_store(self) -> Optional[EmbeddingStore]:
+        """Открывает кэш эмбеддингов чанков; размерность модели входит в имя директории."""
+        if self.embedding_store is None and self._embedding_cache_namespace is not None:
+            with self._embedding_store_lock:
+                if self.embedding_store is None:
+                    dim = len(self.embeddings_loader.embed_query("dimension"))
+                    self.embedding_store = EmbeddingStore(
+                        self.base_path / self.EMBEDDINGS_DIR / f"{self._embedding_cache_namespace}-{dim}d"
+                    )
+        return self.embedding_store
+
+    def _embed_documents(self, token: str, texts: List[str], report: Dict[str, float]) -> list:
+        """Эмбеддинги чанков: известные берутся из общего кэша, модель считает только новые."""
+        store = self._chunk_embedding_store()
+        if store is None:
+            return self.embedding_model.embed_documents(texts)
+
+        embeddings = store.get_many(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        report["cached_chunks"] += len(texts) - len(missing)
+        self.metrics.inc("rag_cache_requests_total", len(texts) - len(missing),
+                         cache="chunk_embedding", result="hit", token=token)
+        self.metrics.inc("rag_cache_requests_total", len(missing),
+                         cache="chunk_embedding", result="miss", token=token)
+        if missing:
+            computed = self.embedding_model.embed_documents([texts[i] for i in missing])
+            store.put_many([texts[i] for i in missing], computed)
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+        return embeddings
+
+    def add_document(self, token: str, filename: str, text: TextSource) -> None:
+        """Добавляет документ в хранилище.
+
+        text - строка или поток блоков (номер страницы, текст), например
+        TextProcessor.iter_pages; номера страниц попадают в метаданные чанков.
+        """
+        with self._locks.build(token):
+            if self.document_exists(token, filename):
+                print("✅ файл уже есть в векторном хранилище")
+                return
+
+            start_time = time.perf_counter()
+            snapshot = self._writable_copy(token)
+            report = {}
+            file_ids = self._embed_into(snapshot, self._split(token, filename, text), report)
+            if not file_ids:
+                print("✅ файл не содержит текста")
+                return
+            report["chunking_s"] = time.perf_counter() - start_time - report["embedding_s"]
+
+            start_time = time.perf_counter()
+            snapshot.documents.add(filename, file_ids[filename])
+            self._maybe_promote(snapshot)
+            self._commit(token, snapshot)
+            report["persist_s"] = time.perf_counter() - start_time
+            self._observe_ingest(token, report)
+            print("✅ файл добавлен в векторное хранилище")
+
+    @staticmethod
+    def _chunk_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def upsert_document(self, token: str, filename: str, text: TextSource) -> Dict[str, float]:
+        """Добавляет документ или обновляет уже загруженный по разнице чанков (см. upsert_documents)."""
+        return self.upsert_documents(token, {filename: text})
+
+    def upsert_documents(self,
+                         token: str,
+                         documents: Union[Dict[str, TextSource], Iterable[Tuple[str, TextSource]]]) -> Dict[str, float]:
+        """Добавляет документы или обновляет уже загруженные по разнице чанков.
+
+        documents - словарь имя файла -> текст или поток пар (имя файла, текст):
+        документы из потока разбираются по одному, по мере поступления.
+
+        Новый текст каждого документа разбивается на чанки, и они сравниваются с
+        чанками в индексе по sha256 текста: эмбеддинги считаются только для новых
+        чанков (пачками по всем документам подряд), исчезнувшие удаляются, у
+        сохранившихся обновляются метаданные (страница, позиция). Все изменения
+        применяются к одной копии индекса, которая записывается один раз.
+        Возвращает число добавленных, удаленных и сохраненных чанков и время этапов.
+        """
+        if isinstance(documents, dict):
+            if not documents:
+                return {"documents": 0, "chunks": 0}
+            documents = documents.items()
+        with self._locks.build(token):
+            start_time = time.perf_counter()
+            snapshot = self._writable_copy(token)
+            docstore = snapshot.vectordb.docstore
+            # Порядок чанков каждого документа: id сохранившегося чанка или новый чанк
+            orders: Dict[str, List[Union[str, Document]]] = {}
+            removed: List[str] = []
+            changed = set()
+            added = set()
+
+            def new_chunks() -> Iterator[Document]:
+                for filename, text in documents:
+                    report["documents"] += 1
+                    if filename not in snapshot.documents:
+                        added.add(filename)
+                    old_ids: Dict[str, List[str]] = {}
+                    for doc_id in snapshot.documents.chunk_ids(filename):
+                        old_ids.setdefault(self._chunk_hash(docstore.search(doc_id).page_content), []).append(doc_id)
+                    order = orders[filename] = []
+                    for doc in self._split(token, filename, text):
+                        matches = old_ids.get(self._chunk_hash(doc.page_content))
+                        if matches:
+                            doc_id = matches.pop(0)
+                            old_doc = docstore.search(doc_id)
+                            if old_doc.metadata != doc.metadata:
+                                old_doc.metadata = doc.metadata
+                                changed.add(filename)
+                            order.append(doc_id)
+                        else:
+                            order.append(doc)
+                            changed.add(filename)
+                            yield doc
+                    leftover = [doc_id for ids in old_ids.values() for doc_id in ids]
+                    if leftover or snapshot.documents.chunk_ids(filename) != order:
+                        changed.add(filename)
+                    removed.extend(leftover)
+
+            report = {"documents": 0, "chunks": 0}
+            file_ids = self._embed_into(snapshot, new_chunks(), report)
+            report["kept"] = sum(isinstance(item, str) for order in orders.values() for item in order)
+            report["removed"] = len(removed)
+            report["chunking_s"] = time.perf_counter() - start_time - report["embedding_s"]
+            report["embedding_chunks_per_s"] = report["chunks"] / max(report["embedding_s"], 1e-9)
+            if not changed:
+                report["persist_s"] = 0.0
+                print(f"✅ {report['documents']} файлов без изменений")
+                return report
+
+            start_time = time.perf_counter()
+            if removed:
+                remove_ids(snapshot.vectordb, removed)
+                snapshot.lexical.remove(removed)
+            for filename in changed:
+                new_ids = iter(file_ids.get(filename, []))
+                ids = [item if isinstance(item, str) else next(new_ids) for item in orders[filename]]
+                if ids:
+                    snapshot.documents.add(filename, ids)
+                else:
+                    snapshot.documents.remove(filename)
+            self._maybe_promote(snapshot)
+            self._commit(token, snapshot)
+            report["persist_s"] = time.perf_counter() - start_time
+            self._observe_ingest(token, report)
+            report["added_documents"] = len(added & changed)
+            report["updated_documents"] = len(changed - added)
+            print(f"✅ векторное хранилище: добавлено файлов {report['added_documents']}, "
+                  f"обновлено {report['updated_documents']}; чанков добавлено {report['chunks']}, "
+                  f"удалено {report['removed']}, без изменений {report['kept']}")
+            return report
+
+    def document_exists(self, token: str, filename: str) -> bool:
+        """Проверяет наличие документа в хранилище."""
+        return filename in self._snapshot(token).documents
+
     def delete_document(self, token: str, filename: str) -> None:
         """Удаляет документ из хранилища."""
-        self.load_for_user(token)
-        if not self.vectordb:
-            return
+        with self._locks.build(token):
+            if not self.document_exists(token, filename):
+                return
 
-        ids = [
-            doc_id for doc_id, doc in self.vectordb.docstore._dict.items()
-            if doc.metadata.get("filename") == filename
-        ]
-        if ids:
-            self.vectordb.delete(ids)
-            self.vectordb.save_local(str(self.base_path / token))
+            snapshot = self._writable_copy(token)
+            ids = snapshot.documents.remove(filename)
+            if ids:
+                remove_ids(snapshot.vectordb, ids)
+                snapshot.lexical.remove(ids)
+            self._commit(token, snapshot)
 
     def list_documents(self, token: str) -> List[str]:
         """Возвращает список документов пользователя."""
-        self.load_for_user(token)
-        if not self.vectordb:
-            return []
-        return list({
-            doc.metadata["filename"]
-            for doc in self.vectordb.docstore._dict.values()
-        })
+        return self._snapshot(token).documents.filenames()
+
+    def document_info(self, token: str, filename: str) -> Optional[dict]:
+        """Возвращает число чанков и время добавления документа."""
+        return self._snapshot(token).documents.info(filename)
+
+    def index_version(self, token: str) -> int:
+        """Возвращает версию индекса токена - номер записи, растет при каждом изменении документов."""
+        return self._snapshot(token).version
+
+    def search(self, token: str, query: str, top_k: int = 5) -> List[Document]:
+        """Ищет top_k релевантных чанков с кэшированием результата.
+
+        В гибридном режиме результаты FAISS и BM25 объединяются через
+        reciprocal rank fusion. Ключ кэша включает версию индекса, поэтому
+        после записи старые результаты не используются.
+        """
+        snapshot = self._snapshot(token)
+        key = (token, normalize_query(query), top_k, snapshot.version)
+        docs = self.result_cache.get(key)
+        if docs is not None:
+            self.metrics.inc("rag_cache_requests_total", cache="result", result="hit", token=token)
+            return list(docs)
+
+        self.metrics.inc("rag_cache_requests_total", cache="result", result="miss", token=token)
+        with self.metrics.timer("rag_stage_seconds", operation="query", stage="embedding", token=token):
+            embedding = np.array([self.embedding_model.embed_query(query)], dtype=np.float32)
+        with self.metrics.timer("rag_stage_seconds", operation="query", stage="search", token=token):
+            if self.hybrid_search:
+                fetch_k = max(top_k * self.fusion_fetch_factor, top_k)
+                ids = self._fuse(
+                    self._vector_search(snapshot, embedding, fetch_k),
+                    [doc_id for doc_id, _ in snapshot.lexical.search(query, fetch_k)]
+                )[:top_k]
+            else:
+                ids = self._vector_search(snapshot, embedding, top_k)
+            docs = [snapshot.vectordb.docstore.search(doc_id) for doc_id in ids]
+        self.result_cache.put(key, docs)
+        return list(docs)
+
+    @staticmethod
+    def _vector_search(snapshot: IndexSnapshot, embedding: np.ndarray, k: int) -> List[str]:
+        """Возвращает id k ближайших к эмбеддингу запроса чанков."""
+        vectordb = snapshot.vectordb
+        _, indices = vectordb.index.search(embedding, min(k, vectordb.index.ntotal))
+        return [vectordb.index_to_docstore_id[i] for i in indices[0] if i != -1]
+
+    def _fuse(self, *rankings: List[str]) -> List[str]:
+        """Reciprocal rank fusion: score(d) = sum 1 / (rrf_k + rank)."""
+        scores: Dict[str, float] = {}
+        for ranking in rankings:
+            for rank, doc_id in enumerate(ranking, start=1):
+                scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank)
+        return sorted(scores, key=scores.get, reverse=True)
 
     def get_retriever(self, token: str, top_k: int = 5):
         """Возвращает retriever для поиска по документам."""
-        self.load_for_user(token)
-        return self.vectordb.as_retriever(search_kwargs={"k": top_k})
+        return self.load_for_user(token).as_retriever(search_kwargs={"k": top_k})
 
     def list_user_tokens(self) -> List[str]:
         """Возвращает список токенов всех пользователей."""
-        return [d.name for d in self.base_path.iterdir() if d.is_dir()]
\ No newline at end of file
+        if not self.base_path.exists():
+            return []
+        return [
+            d.name for d in self.base_path.iterdir()
+            if d.is_dir() and not d.name.startswith(".")
+        ]
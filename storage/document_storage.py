@@ -1,35 +1,128 @@
-from storage.components import FileStorage, VectorStorage
-from typing import List
+from storage.components import FileStorage, VectorStorage, Registry
+from storage.components.vector_storage import TextSource
+from typing import Dict, Iterable, List, Tuple, Union
+from langchain_core.documents import Document
 
 
 class DocumentStorage:
     """Класс для работы с документами. Является посредником между хранилищами и остальной логикой.
-    Собирает вместе файловое и векторное хранилище."""
+    Собирает вместе файловое и векторное хранилище, а реестр хранит список
+    токенов и документов, чтобы не обходить для этого файловую систему."""
+
+    # Служебный файл, которым create_token создает директорию токена; документом не считается
+    PLACEHOLDER_FILE = "__init__.txt"
 
     def __init__(self,
                  vector_store: VectorStorage,
-                 file_store: FileStorage):
-        """Инициализирует хранилища документов."""
+                 file_store: FileStorage,
+                 registry: Registry):
+        """Инициализирует хранилища документов.
+
+        Пустой реестр (первый запуск) заполняется по содержимому хранилищ.
+        """
         self.vector_store = vector_store
         self.file_store = file_store
+        self.registry = registry
+        if registry.is_empty():
+            self.sync_registry()
+
+    def sync_registry(self) -> None:
+        """Перестраивает реестр по файловому и векторному хранилищам."""
+        file_tokens = set(self.file_store.list_user_tokens())
+        vector_tokens = set(self.vector_store.list_user_tokens())
+        documents = {}
+        for token in file_tokens & vector_tokens:
+            filenames = set(self.file_store.list_documents(token)) & set(self.vector_store.list_documents(token))
+            documents[token] = {
+                filename: self.vector_store.document_info(token, filename)["chunks"]
+                for filename in filenames
+            }
+        self.registry.replace_all(documents)
+        print(f"Реестр синхронизирован с хранилищами: {len(documents)} токенов")
 
-    def add_document(self, token: str, filename: str, text: str):
-        """Добавляет документ в оба хранилища."""
-        self.file_store.add_document(token, filename, text)
+    def _register(self, token: str, filename: str) -> None:
+        """Записывает в реестр документ, если он попал в векторное хранилище."""
+        info = self.vector_store.document_info(token, filename)
+        if info is not None:
+            self.registry.set_document(token, filename, info["chunks"])
+        else:
+            self.registry.add_token(token)
+
+    def create_token(self, token: str) -> None:
+        """Создает пустой токен в обоих хранилищах и в реестре."""
+        self.file_store.add_document(token, self.PLACEHOLDER_FILE, "Initial file")
+        self.vector_store.load_for_user(token)
+        self.registry.add_token(token)
+
+    def add_document(self, token: str, filename: str, text: TextSource):
+        """Добавляет документ в оба хранилища.
+
+        Если вместо строки передан поток блоков (страница, текст), исходный файл
+        уже должен лежать в файловом хранилище - в него пишется только строка.
+        """
+        if isinstance(text, str):
+            self.file_store.add_document(token, filename, text)
         self.vector_store.add_document(token, filename, text)
+        self._register(token, filename)
+
+    def upsert_document(self, token: str, filename: str, text: TextSource) -> Dict[str, float]:
+        """Добавляет или обновляет документ в обоих хранилищах и в реестре (см. upsert_documents)."""
+        return self.upsert_documents(token, {filename: text})
+
+    def upsert_documents(self,
+                         token: str,
+                         documents: Union[Dict[str, TextSource], Iterable[Tuple[str, TextSource]]]) -> Dict[str, float]:
+        """Добавляет или обновляет документы в обоих хранилищах и в реестре.
+
+        documents - словарь или поток пар (имя файла, текст), который читается по
+        мере разбора. В векторном хранилище заново считаются эмбеддинги только
+        измененных чанков, индекс записывается один раз (см. VectorStorage.upsert_documents).
+        Поток блоков, как и в add_document, означает, что новая версия файла уже
+        лежит в файловом хранилище.
+        """
+        filenames = []
+
+        def items():
+            for filename, text in (documents.items() if isinstance(documents, dict) else documents):
+                if isinstance(text, str):
+                    self.file_store.add_document(token, filename, text, overwrite=True)
+                filenames.append(filename)
+                yield filename, text
+
+        report = self.vector_store.upsert_documents(token, items())
+        for filename in filenames:
+            if self.vector_store.document_exists(token, filename):
+                self._register(token, filename)
+            else:
+                # В новой версии файла не осталось текста
+                self.registry.remove_document(token, filename)
+        return report
+
+    def delete_document(self, token: str, filename: str) -> None:
+        """Удаляет документ из векторного хранилища и реестра."""
+        self.vector_store.delete_document(token, filename)
+        self.registry.remove_document(token, filename)
 
     def get_retriever(self, token: str, top_k: int = 5):
         """Возвращает retriever для поиска документов."""
         return self.vector_store.get_retriever(token, top_k)
 
+    def search(self, token: str, query: str, top_k: int = 5) -> List[Document]:
+        """Возвращает top_k релевантных чанков (с кэшированием результатов)."""
+        return self.vector_store.search(token, query, top_k)
+
+    def index_version(self, token: str) -> int:
+        """Возвращает версию векторного индекса токена."""
+        return self.vector_store.index_version(token)
+
     def list_documents(self, token: str) -> List[str]:
         """Возвращает список документов пользователя."""
-        file_documents = set(self.file_store.list_documents(token))
-        vector_documents = set(self.vector_store.list_documents(token))
-        return list(file_documents & vector_documents)
+        return self.registry.list_documents(token)
 
     def list_user_tokens(self) -> List[str]:
         """Возвращает список токенов пользователей."""
-        file_tokens = set(self.file_store.list_user_tokens())
-        vector_tokens = set(self.vector_store.list_user_tokens())
-        return list(file_tokens & vector_tokens)
\ No newline at end of file
+        return self.registry.list_tokens()
+
+    def has_token(self, token: str) -> bool:
+        """Проверяет, существует ли токен."""
+        return self.registry.has_token(token)
\ No newline at end of file